@@ -17,8 +17,9 @@ class GazeboEnv(gym.Env):
     def __init__(self, launchfile):
 
         random_number = random.randint(10000, 15000)
-        self.port = "11311"#str(random_number) #os.environ["ROS_PORT_SIM"]
-        self.port_gazebo = str(random_number+1) #os.environ["ROS_PORT_SIM"]
+        # ROS_PORT_SIM/GAZEBO_PORT_SIM let several instances run side by side
+        self.port = os.environ.get("ROS_PORT_SIM", "11311")#str(random_number)
+        self.port_gazebo = os.environ.get("GAZEBO_PORT_SIM", str(random_number+1))
         # os.environ["ROS_MASTER_URI"] = "http://localhost:"+self.port
         # os.environ["GAZEBO_MASTER_URI"] = "http://localhost:"+self.port_gazebo
         #
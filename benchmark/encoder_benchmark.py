@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+'''
+rgbd encoder benchmark, runs without ROS/Gazebo.
+
+Builds the vector/rgbd encoder of runfile/ddpg_config.py for every variant
+of config.layers['rgbd'] below (see module/spec.py for the entries) and
+times, on the CPU at --batch-size, the forward pass and the forward plus
+backward pass (gradients of the summed features with respect to the
+encoder variables). Results are written as one JSON object per line.
+
+    python benchmark/encoder_benchmark.py --batch-size 64 --repeat 20
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import copy
+import numpy as np
+
+root=os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+sys.path.insert(0,root)
+sys.path.insert(0,os.path.join(root,'runfile'))
+import tensorflow as tf
+from module.ddpg import Build_network
+from ddpg_config import Settings
+
+VARIANTS={
+    # the default encoder, stride 1 convs each followed by 2x2 max-pool
+    'legacy':None,
+    'wide_pool':[
+        [5,5,7,16],
+        [3,3,16,32],
+        [3,3,32,32]
+    ],
+    'strided':[
+        ('conv',[5,5,7,16],{'stride':2,'pool':False}),
+        ('conv',[3,3,16,32],{'stride':2,'pool':False}),
+        ('conv',[3,3,32,32],{'stride':2,'pool':False})
+    ],
+    'separable':[
+        ('conv',[5,5,7,16],{'stride':2,'pool':False}),
+        ('separable',[3,3,16,32],{'stride':2,'pool':False}),
+        ('separable',[3,3,32,32],{'stride':2,'pool':False})
+    ],
+    'global_pool':[
+        ('conv',[5,5,7,16],{'stride':2,'pool':False}),
+        ('separable',[3,3,16,32],{'stride':2,'pool':False}),
+        ('separable',[3,3,32,64],{'stride':2,'pool':False}),
+        ('global_pool','avg')
+    ]
+}
+
+def timed(sess,fetches,feed_dict,repeat):
+    sess.run(fetches,feed_dict=feed_dict)
+    times=[]
+    for _ in range(repeat):
+        start=time.time()
+        sess.run(fetches,feed_dict=feed_dict)
+        times.append(time.time()-start)
+    return float(np.median(times)*1e3)
+
+def run(variant,args):
+    config=Settings()
+    config.gpu=False
+    config.layers=copy.deepcopy(config.layers)
+    if VARIANTS[variant] is not None:
+        config.layers['rgbd']=VARIANTS[variant]
+    graph=tf.Graph()
+    with graph.as_default():
+        sess=tf.Session(graph=graph)
+        encoder=Build_network(sess,config,'encoder_net')
+        rgbd_vars=[var for var in encoder.var_list if '/rgbd' in var.name]
+        gradients=tf.gradients(tf.reduce_sum(encoder.features),encoder.var_list)
+        sess.run(tf.global_variables_initializer())
+        rng=np.random.RandomState(args.seed)
+        feed_dict={encoder.state_vector:rng.rand(args.batch_size,config.vector_dim[1]), \
+                   encoder.state_rgbd:rng.randint(0,256,[args.batch_size]+config.rgbd_dim[1:]) \
+                                      .astype(np.uint8)}
+        result={'benchmark':'encoder','variant':variant,'batch_size':args.batch_size, \
+                'features':int(encoder.features.get_shape()[1]), \
+                'rgbd_parameters':int(sum(np.prod(var.get_shape().as_list()) for var in rgbd_vars)), \
+                'forward_ms':timed(sess,encoder.features,feed_dict,args.repeat), \
+                'forward_backward_ms':timed(sess,gradients,feed_dict,args.repeat)}
+        sess.close()
+    return result
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, \
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variants',nargs='+',default=sorted(VARIANTS.keys()), \
+                        choices=sorted(VARIANTS.keys()))
+    parser.add_argument('--batch-size',type=int,default=64)
+    parser.add_argument('--repeat',type=int,default=20,help='runs per measurement, median reported')
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--output',default=None,help='JSON lines file, stdout if omitted')
+    args=parser.parse_args()
+    out=open(args.output,'a') if args.output else sys.stdout
+    for variant in args.variants:
+        result=run(variant,args)
+        result['time']=time.time()
+        out.write(json.dumps(result)+'\n')
+        out.flush()
+    if args.output:
+        out.close()
+
+if __name__=='__main__':
+    main()
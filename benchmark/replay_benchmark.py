@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+'''
+Replay buffer benchmark, runs without ROS/Gazebo.
+
+Fills a Replay with synthetic observations shaped like the gazebo streams
+(vector [42] float32, rgbd [96,128,7] uint8) and reports, for every storage
+mode, add() throughput while filling up to each fill level, batch() latency
+at that level for every batch size, and the peak RSS of the process. Each
+mode runs in its own process so the RSS figures are comparable. Results are
+written as one JSON object per line.
+
+    python benchmark/replay_benchmark.py --fills 1000 10000 100000 \
+        --batch-sizes 32 64 128 --modes plain prioritized --output replay.jsonl
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import shutil
+import multiprocessing
+import numpy as np
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir))
+from module.replay import Replay
+
+MODES={
+    'plain':{},
+    'prioritized':{'prioritized':True},
+    'compress':{'compress':True},
+    'persistent':{'path':True},
+    'n_step':{'n_step':3}
+}
+
+def observations(count,seed=0):
+    # smooth images with sensor noise and a float32 depth ramp, so that the
+    # compressed mode sees data roughly as compressible as rendered frames.
+    # a pool of count frames is generated up front and cycled, keeping the
+    # generation cost out of the add() timings.
+    rng=np.random.RandomState(seed)
+    y,x=np.mgrid[0:96,0:128]
+    pool=[]
+    for t in range(count):
+        rgb=np.stack([(2*x+t)%256,(2*y+t)%256,(x+y+t)%256],-1)+rng.randint(0,8,[96,128,3])
+        depth=(1.0+0.02*y+0.001*x+0.001*t+1e-3*rng.rand(96,128)).astype(np.float32)
+        pool.append({'vector':rng.rand(42).astype(np.float32), \
+                     'rgbd':np.concatenate([rgb.astype(np.uint8), \
+                                            depth.view(np.uint8).reshape([96,128,4])],-1)})
+    while True:
+        for state in pool:
+            yield state
+
+def peak_rss():
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run(mode,args,results):
+    kwargs=dict(MODES[mode])
+    directory=None
+    if kwargs.get('path'):
+        directory=tempfile.mkdtemp(prefix='replay_benchmark_')
+        kwargs['path']=directory
+    try:
+        memory=Replay(max(args.fills),max(args.batch_sizes),**kwargs)
+        frames=observations(args.pool,args.seed)
+        state0=next(frames)
+        added=0
+        for fill in sorted(args.fills):
+            previous=added
+            start=time.time()
+            while added<fill:
+                state1=next(frames)
+                added+=1
+                done=added%args.episode==0
+                memory.add({'vector0':state0['vector'],'rgbd0':state0['rgbd'], \
+                            'vector1':state1['vector'],'rgbd1':state1['rgbd'], \
+                            'action0':np.zeros(3,dtype=np.float32), \
+                            'reward':1.0,'done':done})
+                state0=next(frames) if done else state1
+            elapsed=time.time()-start
+            results.put({'benchmark':'add','mode':mode,'fill':fill, \
+                         'adds':added-previous, \
+                         'adds_per_second':(added-previous)/max(elapsed,1e-9), \
+                         'peak_rss_kb':peak_rss()})
+            for batch_size in args.batch_sizes:
+                memory.batch_size=batch_size
+                memory.batch()
+                times=[]
+                for _ in range(args.repeat):
+                    start=time.time()
+                    batch=memory.batch()
+                    times.append(time.time()-start)
+                    if 'indices' in batch:
+                        memory.update_priorities(batch['indices'], \
+                                                 np.random.rand(len(batch['indices'])))
+                times=np.array(times)*1e3
+                results.put({'benchmark':'batch','mode':mode,'fill':fill, \
+                             'batch_size':batch_size, \
+                             'latency_ms_mean':float(times.mean()), \
+                             'latency_ms_p50':float(np.percentile(times,50)), \
+                             'latency_ms_p95':float(np.percentile(times,95)), \
+                             'peak_rss_kb':peak_rss()})
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+    results.put(None)
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, \
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fills',type=int,nargs='+',default=[1000,10000,100000])
+    parser.add_argument('--batch-sizes',type=int,nargs='+',default=[32,64,128])
+    parser.add_argument('--modes',nargs='+',default=sorted(MODES.keys()),choices=sorted(MODES.keys()))
+    parser.add_argument('--repeat',type=int,default=50,help='batch() calls per measurement')
+    parser.add_argument('--episode',type=int,default=200,help='transitions per episode')
+    parser.add_argument('--pool',type=int,default=256,help='distinct synthetic frames')
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--output',default=None,help='JSON lines file, stdout if omitted')
+    args=parser.parse_args()
+    out=open(args.output,'a') if args.output else sys.stdout
+    for mode in args.modes:
+        results=multiprocessing.Queue()
+        process=multiprocessing.Process(target=run,args=(mode,args,results))
+        process.start()
+        while True:
+            try:
+                result=results.get(timeout=1.0)
+            except Exception:
+                if process.is_alive():
+                    continue
+                raise RuntimeError('benchmark of mode %s exited with code %s' \
+                                   %(mode,process.exitcode))
+            if result is None:
+                break
+            result['time']=time.time()
+            out.write(json.dumps(result)+'\n')
+            out.flush()
+        process.join()
+    if args.output:
+        out.close()
+
+if __name__=='__main__':
+    main()
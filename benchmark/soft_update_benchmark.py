@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+'''
+Soft target update benchmark, runs without ROS/Gazebo.
+
+Builds the DDPG graph from runfile/ddpg_config.py on the CPU and times
+whole learn() steps on a random batch of config.batch_size transitions,
+which include the target forward passes and the soft target update, for
+every config.target_update_every value in --every. With --baseline the
+module/ddpg.py of that git revision is timed the same way, e.g. the
+revision before the targets were flattened into one vector (one target
+variable per online variable, one assign each, run every step).
+Results are written as one JSON object per line.
+
+    python benchmark/soft_update_benchmark.py --every 1 4 16 --repeat 64 \
+        --baseline <revision>
+'''
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import subprocess
+import numpy as np
+
+root=os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+sys.path.insert(0,root)
+sys.path.insert(0,os.path.join(root,'runfile'))
+import tensorflow as tf
+from module import ddpg
+from ddpg_config import Settings
+
+def revision(rev):
+    # module/ddpg.py of a git revision, importing the current siblings
+    source=subprocess.check_output(['git','show',rev+':module/ddpg.py'],cwd=root)
+    baseline=types.ModuleType('module.ddpg_baseline')
+    baseline.__package__='module'
+    sys.modules[baseline.__name__]=baseline
+    exec(compile(source,rev+':module/ddpg.py','exec'),baseline.__dict__)
+    return baseline
+
+def random_batch(config):
+    size=config.batch_size
+    vector=[size]+config.vector_dim[1:]
+    rgbd=[size]+config.rgbd_dim[1:]
+    return {'vector0':np.random.rand(*vector),'vector1':np.random.rand(*vector), \
+            'rgbd0':np.random.randint(0,256,rgbd).astype(np.uint8), \
+            'rgbd1':np.random.randint(0,256,rgbd).astype(np.uint8), \
+            'action0':np.random.rand(size,config.action_dim), \
+            'reward':np.random.rand(size),'done':np.zeros(size,dtype=bool)}
+
+def timed(agent,batch,repeat,every):
+    # whole cycles of every steps, so each soft update is counted once
+    for _ in range(every):
+        agent.learn(batch)
+    steps=-(-repeat//every)*every
+    start=time.time()
+    for _ in range(steps):
+        agent.learn(batch)
+    return (time.time()-start)/steps*1e3
+
+def measure(ddpg_module,config,batch,repeat,every):
+    with tf.Graph().as_default():
+        agent=ddpg_module.DDPG(config)
+        ms=timed(agent,batch,repeat,every)
+        agent.sess.close()
+    return ms
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__, \
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--every',type=int,nargs='+',default=[1,4,16], \
+                        help='target_update_every values')
+    parser.add_argument('--repeat',type=int,default=64,help='learn() steps per measurement')
+    parser.add_argument('--baseline',default=None, \
+                        help='git revision of module/ddpg.py to time as well')
+    parser.add_argument('--shared-encoder',action='store_true')
+    parser.add_argument('--output',default=None,help='JSON lines file, stdout if omitted')
+    args=parser.parse_args()
+    config=Settings()
+    config.gpu=False
+    config.shared_encoder=args.shared_encoder
+    batch=random_batch(config)
+    common={'benchmark':'soft_update','batch_size':config.batch_size, \
+            'shared_encoder':args.shared_encoder}
+    results=[]
+    if args.baseline is not None:
+        config.target_update_every=1
+        results.append(dict(common,mode='baseline',revision=args.baseline,every=1, \
+            ms_per_step=measure(revision(args.baseline),config,batch,args.repeat,1)))
+    for every in args.every:
+        config.target_update_every=every
+        results.append(dict(common,mode='flat',every=every, \
+            ms_per_step=measure(ddpg,config,batch,args.repeat,every)))
+    out=open(args.output,'a') if args.output else sys.stdout
+    for result in results:
+        result['time']=time.time()
+        out.write(json.dumps(result)+'\n')
+    if args.output:
+        out.close()
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,73 @@
+import os
+import json
+import threading
+import numpy as np
+import tensorflow as tf
+
+class Checkpoint(object):
+    '''
+    Saves and restores a fixed set of float32 variables. All variables are
+    fetched in one sess.run and written on a background thread as
+    path.bin, every variable flattened back to back, plus path.json with
+    the offset and shape of each, so that read() can memory-map them.
+    Restoring feeds prebuilt placeholders, it adds no ops to the graph.
+    '''
+
+    def __init__(self,sess,variables):
+        self.sess=sess
+        self.names=sorted(variables.keys())
+        self.variables=[variables[name] for name in self.names]
+        self.placeholders=[tf.placeholder(var.dtype.base_dtype,var.get_shape()) \
+                           for var in self.variables]
+        self.restore_op=tf.group(*[var.assign(placeholder) \
+                           for var,placeholder in zip(self.variables,self.placeholders)])
+        self.writer=None
+
+    def fetch(self):
+        return dict(zip(self.names,self.sess.run(self.variables)))
+
+    def restore(self,values):
+        self.sess.run(self.restore_op,feed_dict={placeholder:values[name] \
+            for name,placeholder in zip(self.names,self.placeholders)})
+
+    def save(self,path,wait=False,values=None):
+        # values: the result of an earlier fetch(), fetched now if None
+        if values is None:
+            values=self.fetch()
+        self.wait()
+        self.writer=threading.Thread(target=write,args=(path,values))
+        self.writer.start()
+        if wait:
+            self.wait()
+
+    def wait(self):
+        # block until the last save is on disk
+        if self.writer is not None:
+            self.writer.join()
+            self.writer=None
+
+def write(path,values):
+    index={}
+    offset=0
+    for name in sorted(values.keys()):
+        index[name]=[offset,list(np.shape(values[name]))]
+        offset+=int(np.size(values[name]))
+    # write then rename, a crash never leaves a half written checkpoint
+    with open(path+'.bin.tmp','wb') as f:
+        for name in sorted(values.keys()):
+            f.write(np.ascontiguousarray(values[name],dtype='<f4').tobytes())
+    with open(path+'.json.tmp','w') as f:
+        json.dump({'size':offset,'variables':index},f)
+    os.rename(path+'.bin.tmp',path+'.bin')
+    os.rename(path+'.json.tmp',path+'.json')
+
+def read(path,mmap_mode='r'):
+    # name -> array, views into one memory-mapped file unless mmap_mode is None
+    with open(path+'.json') as f:
+        index=json.load(f)
+    if mmap_mode is None:
+        flat=np.fromfile(path+'.bin',dtype='<f4')
+    else:
+        flat=np.memmap(path+'.bin',dtype='<f4',mode=mmap_mode,shape=(index['size'],))
+    return {name:flat[offset:offset+int(np.prod(shape))].reshape(shape) \
+            for name,(offset,shape) in index['variables'].items()}
@@ -1,6 +1,12 @@
 import tensorflow as tf
 import numpy as np
 import copy
+import json
+import threading
+
+from . import checkpoint
+from .profiler import Profiler
+from .spec import rgbd_layer
 
 class DDPG:
     def __init__(self, config):
@@ -18,61 +24,162 @@ class DDPG:
         self.rgbd_dim[0]=-1
         self.gamma=tf.constant(config.gamma,dtype=tf.float32,name='gamma')
         self.sess=tf.Session(config=sess_config)
+        # what numpy_actor needs to rebuild the actor
+        self.architecture={'layers':copy.deepcopy(config.layers), \
+                           'rgbd_dim':list(config.rgbd_dim[1:]), \
+                           'rgbd_scale':config.rgbd_scale, \
+                           'action_bounds':config.action_bounds}
         self.var_init=tf.global_variables_initializer()
         self.reward=tf.placeholder(tf.float32,[None,1])
         self.done=tf.placeholder(tf.float32,[None,1])
-        self.target_q=tf.placeholder(tf.float32,[None,1])
+        self.vector1=tf.placeholder(tf.float32,config.vector_dim)
+        self.rgbd1=tf.placeholder(tf.uint8,config.rgbd_dim)
+        # per-sample discount of n-step transitions
+        self.discount=tf.placeholder_with_default( \
+            self.gamma*tf.ones_like(self.reward),[None,1])
+        # importance sampling weights of a prioritized batch
+        self.weights=tf.placeholder_with_default(tf.ones_like(self.reward),[None,1])
         # self.noise=tf.placeholder(tf.float32,[None,config.action_dim])
-        # build network
-        self.actor_net=Build_network(self.sess,config,'actor_net')
-        self.actor_target=Build_network(self.sess,config,'actor_target')
-        self.critic_net=Build_network(self.sess,config,'critic_net')
-        self.critic_target=Build_network(self.sess,config,'critic_target')
-        # update critic
-        y=self.reward+tf.multiply(self.gamma,tf.multiply(self.target_q,1.0-self.done))
+        # build network, the critic shares the state placeholders of the
+        # actor and the targets are evaluated in the graph on vector1/rgbd1
+        self.shared_encoder=config.shared_encoder
+        if self.shared_encoder:
+            # one vector/rgbd encoder (and its target copy) feeds all heads,
+            # so every update encodes rgbd0 and rgbd1 once. the encoder is
+            # trained by the critic loss only
+            self.encoder_net=Build_network(self.sess,config,'encoder_net')
+            inputs0={'vector':self.encoder_net.state_vector, \
+                     'rgbd':self.encoder_net.state_rgbd, \
+                     'features':self.encoder_net.features}
+            self.actor_net=Build_network(self.sess,config,'actor_net', \
+                inputs=dict(inputs0,features=tf.stop_gradient(self.encoder_net.features)))
+        else:
+            self.actor_net=Build_network(self.sess,config,'actor_net')
+            inputs0={'vector':self.actor_net.state_vector,'rgbd':self.actor_net.state_rgbd}
+        self.critic_net=Build_network(self.sess,config,'critic_net',inputs=inputs0)
+        self.online=[self.actor_net,self.critic_net]
+        critic_vars=self.critic_net.var_list
+        if self.shared_encoder:
+            self.online.append(self.encoder_net)
+            critic_vars=critic_vars+self.encoder_net.var_list
+        # the target networks read their parameters as views of one flat
+        # variable, so a target update is a single op on a contiguous vector
+        online_vars=[var for net in self.online for var in net.var_list]
+        self.online_params=flatten(online_vars)
+        self.target_params=tf.Variable(tf.zeros(self.online_params.get_shape()), \
+            trainable=False,name='target_params')
+        target_vars={}
+        offset=0
+        for var in online_vars:
+            shape=var.get_shape().as_list()
+            size=int(np.prod(shape))
+            target_vars[var.name.replace('_net/','_target/',1)]= \
+                tf.reshape(self.target_params[offset:offset+size],shape)
+            offset+=size
+        if self.shared_encoder:
+            self.encoder_target=Build_network(self.sess,config,'encoder_target', \
+                inputs={'vector':self.vector1,'rgbd':self.rgbd1},params=target_vars)
+            inputs1={'vector':self.vector1,'rgbd':self.rgbd1, \
+                     'features':self.encoder_target.features}
+        else:
+            inputs1={'vector':self.vector1,'rgbd':self.rgbd1}
+        self.actor_target=Build_network(self.sess,config,'actor_target', \
+            inputs=inputs1,params=target_vars)
+        self.critic_target=Build_network(self.sess,config,'critic_target', \
+            inputs=dict(inputs1,action=self.actor_target.out_),params=target_vars)
+        self.target_q=tf.stop_gradient(self.critic_target.out_)
+        # with an asynchronous learner the actions come from a behaviour copy
+        # of the actor, refreshed by publish_actor() between updates
+        self.actor=self.actor_net
+        self.behaviour=[]
+        if config.async_learner:
+            if self.shared_encoder:
+                encoder=Build_network(self.sess,config,'encoder_behaviour')
+                self.actor=Build_network(self.sess,config,'actor_behaviour', \
+                    inputs={'vector':encoder.state_vector,'rgbd':encoder.state_rgbd, \
+                            'features':encoder.features})
+                self.behaviour.append((self.encoder_net,encoder))
+            else:
+                self.actor=Build_network(self.sess,config,'actor_behaviour')
+            self.behaviour.append((self.actor_net,self.actor))
+        self.behaviour_lock=threading.Lock()
+        # held by learn() and by the fetches of save() and export_actor(),
+        # so a snapshot taken while a learner thread runs is one update
+        self.learn_lock=threading.Lock()
+        # critic gradients
+        y=self.reward+tf.multiply(self.discount,tf.multiply(self.target_q,1.0-self.done))
         # y=self.reward+tf.multiply(self.gamma,self.target_q)
-        q_loss=tf.reduce_sum(tf.pow(self.critic_net.out_-y,2))/config.batch_size+ \
-            config.l2_penalty*l2_regularizer(self.critic_net.var_list)
-        self.update_critic=tf.train.AdamOptimizer( \
-            learning_rate=config.critic_learning_rate).minimize(q_loss,var_list=self.critic_net.var_list)
-        # update actor
+        self.td_error=y-self.critic_net.out_
+        q_loss=tf.reduce_sum(self.weights*tf.pow(self.td_error,2))/config.batch_size+ \
+            config.l2_penalty*l2_regularizer(critic_vars)
+        critic_optimizer=tf.train.AdamOptimizer(learning_rate=config.critic_learning_rate)
+        critic_gradients=critic_optimizer.compute_gradients(q_loss,var_list=critic_vars)
+        # actor gradients, taken from the same critic forward pass
         act_grad_v=tf.gradients(self.critic_net.out_,self.critic_net.action)
-        action_gradients=[act_grad_v[0]/tf.to_float(tf.shape(act_grad_v[0])[0])]
+        action_gradients=act_grad_v[0]/tf.to_float(tf.shape(act_grad_v[0])[0])
         del_Q_a=gradient_inverter( \
             config.action_bounds,action_gradients,self.actor_net.out_)
         parameters_gradients=tf.gradients(
             self.actor_net.out_,self.actor_net.var_list,-del_Q_a)
-        self.update_actor=tf.train.AdamOptimizer( \
-            learning_rate=config.actor_learning_rate) \
-            .apply_gradients(zip(parameters_gradients,self.actor_net.var_list))
-        # target copy
-        self.assign_target= \
-            [self.actor_target.variables[var].assign( \
-                self.actor_net.variables[var.replace('_target','_net')] \
-            ) for var in self.actor_target.variables.keys()]+ \
-            [self.critic_target.variables[var].assign( \
-                self.critic_net.variables[var.replace('_target','_net')] \
-            ) for var in self.critic_target.variables.keys()]
-        self.assign_target_soft= \
-            [self.actor_target.variables[var].assign( \
-                config.tau*self.actor_net.variables[var.replace('_target','_net')]+ \
-                (1-config.tau)*self.actor_target.variables[var] \
-            ) for var in self.actor_target.variables.keys()]+ \
-            [self.critic_target.variables[var].assign( \
-                config.tau*self.critic_net.variables[var.replace('_target','_net')]+ \
-                (1-config.tau)*self.critic_target.variables[var] \
-            ) for var in self.critic_target.variables.keys()]
+        # variables without a gradient (unused biases) are left out
+        actor_gradients=[(grad,var) for grad,var in \
+            zip(parameters_gradients,self.actor_net.var_list) if grad is not None]
+        # one step: critic update, then actor update, then soft target update.
+        # both gradients (and the fetched td_error) read the critic before
+        # its update
+        actor_optimizer=tf.train.AdamOptimizer(learning_rate=config.actor_learning_rate)
+        with tf.control_dependencies([grad for grad,_ in actor_gradients]+[self.td_error]):
+            self.update_critic=critic_optimizer.apply_gradients(critic_gradients)
+        with tf.control_dependencies([self.update_critic]):
+            self.update_actor=actor_optimizer.apply_gradients(actor_gradients)
+        # target copy. with target_update_every=k the soft update runs every
+        # k-th step with tau_k=1-(1-tau)**k, the decay of k updates with tau
+        self.target_update_every=config.target_update_every
+        tau=1.0-(1.0-config.tau)**self.target_update_every
+        self.assign_target=self.target_params.assign(self.online_params)
+        self.train=tf.group(self.update_actor)
+        with tf.control_dependencies([self.update_actor]):
+            # read the online parameters again, after the updates
+            self.train_soft=self.target_params.assign_sub( \
+                tau*(self.target_params-flatten(online_vars)))
+        self.updates=0
+        # unfused ops, one sess.run per phase, to time the phases separately.
+        # they share the optimizer state of the fused step. the critic phase
+        # fetches the actor gradients before its update and the actor phase
+        # applies them, as the fused step does
+        self.profile_phases=config.profile_phases
+        if self.profile_phases:
+            self.actor_gradients=[grad for grad,_ in actor_gradients]
+            with tf.control_dependencies(self.actor_gradients+[self.td_error]):
+                self.critic_step=critic_optimizer.apply_gradients(critic_gradients)
+            self.actor_feed=[tf.placeholder(grad.dtype,grad.get_shape()) \
+                             for grad in self.actor_gradients]
+            self.actor_step=actor_optimizer.apply_gradients( \
+                zip(self.actor_feed,[var for _,var in actor_gradients]))
+            self.soft_step=self.target_params.assign_sub( \
+                tau*(self.target_params-self.online_params))
+        self.profiler=Profiler(config.trace_dir,config.trace_start,config.trace_steps)
         # initialize variables
         self.var_init=tf.global_variables_initializer()
         self.sess.run(self.var_init)
+        self.publish=tf.group(*[behaviour.variables[var].assign( \
+                net.variables[var.replace('_behaviour','_net')] \
+            ) for net,behaviour in self.behaviour for var in behaviour.variables.keys()])
         self.sess.run(self.assign_target)
+        self.publish_actor()
+        self.checkpoint=checkpoint.Checkpoint(self.sess, \
+            {var.name:var for var in online_vars})
         self.a_scale,self.a_mean=self.sess.run(
             [self.actor_net.a_scale,self.actor_net.a_mean])
+        # actor forward pass without the per-call feed/fetch lookup
+        self.act=self.sess.make_callable(self.actor.out_, \
+            feed_list=[self.actor.state_vector,self.actor.state_rgbd])
 
     def chooseAction(self,state):
         state_vector=np.reshape(state['vector'],[1,-1])
-        state_rgbd=np.reshape(state['rgbd'],[1,96,128,7])
-        action=self.actor_net.evaluate(state_vector,state_rgbd)
+        state_rgbd=np.reshape(state['rgbd'],[1,96,128,7]).astype(np.uint8,copy=False)
+        with self.behaviour_lock:
+            action=self.act(state_vector,state_rgbd)
         # action=self.sess.run(self.actor_net.out_before_activation, \
         #     feed_dict={self.actor_net.state_vector:state_vector, \
         #                self.actor_net.state_rgbd:state_rgbd})
@@ -82,97 +189,194 @@ class DDPG:
         action=action+self.epsilon*self.action_scale*np.random.randn(1,self.action_dim)
         return np.reshape(action,[self.action_dim])
 
+    def choose_actions(self,states):
+        '''
+        actions for N environments in one forward pass. states is a list of
+        state dicts or a dict of stacked [N,...] 'vector' and 'rgbd' arrays,
+        exploration noise is drawn independently for every row.
+        '''
+        if isinstance(states,dict):
+            vector,rgbd=states['vector'],states['rgbd']
+        else:
+            vector=np.stack([state['vector'] for state in states])
+            rgbd=np.stack([state['rgbd'] for state in states])
+        vector=np.reshape(vector,self.vector_dim)
+        rgbd=np.reshape(rgbd,self.rgbd_dim).astype(np.uint8,copy=False)
+        with self.behaviour_lock:
+            actions=self.act(vector,rgbd)
+        return actions+self.epsilon*self.action_scale*np.random.randn(len(actions),self.action_dim)
+
+    def publish_actor(self):
+        # copy the trained actor to the behaviour actor
+        if self.behaviour:
+            with self.behaviour_lock:
+                self.sess.run(self.publish)
+
+    def prepare(self,batch):
+        # reshape and convert a replay batch to the layout fed to the graph.
+        # learn() calls it as well, it is a no-op on a prepared batch.
+        # rgbd stays uint8, it is converted in the graph
+        prepared=dict(batch)
+        for key in ['vector0','vector1']:
+            prepared[key]=np.reshape(batch[key],self.vector_dim)
+        for key in ['rgbd0','rgbd1']:
+            prepared[key]=np.reshape(batch[key],self.rgbd_dim).astype(np.uint8,copy=False)
+        prepared['action0']=np.reshape(batch['action0'],[-1,self.action_dim])
+        for key in ['reward','done','discount','weights']:
+            if key in batch:
+                prepared[key]=np.reshape(batch[key],[-1,1]).astype(np.float32,copy=False)
+        return prepared
+
     def learn(self,batch):
-        vector0=np.reshape(batch['vector0'],self.vector_dim)
-        rgbd0=np.reshape(batch['rgbd0'],self.rgbd_dim)
-        vector1=np.reshape(batch['vector1'],self.vector_dim)
-        rgbd1=np.reshape(batch['rgbd1'],self.rgbd_dim)
-        action0=np.reshape(batch['action0'],[-1,self.action_dim])
-        reward=np.reshape(batch['reward'],[-1,1])
-        done=np.reshape(batch['done'],[-1,1])
-        target_action=self.actor_target.evaluate(vector1,rgbd1)
-        target_q=self.critic_target.evaluate(vector1,rgbd1,action=target_action)
-        self.sess.run(self.update_critic, \
-                      feed_dict={self.critic_net.state_vector:vector0, \
-                                 self.critic_net.state_rgbd:rgbd0, \
-                                 self.critic_net.action:action0, \
-                                 self.reward:reward, \
-                                 self.target_q:target_q, \
-                                 self.done:done})
-        self.sess.run(self.update_actor, \
-                      feed_dict={self.critic_net.state_vector:vector0, \
-                                 self.critic_net.state_rgbd:rgbd0, \
-                                 self.critic_net.action:action0, \
-                                 self.actor_net.state_vector:vector0, \
-                                 self.actor_net.state_rgbd:rgbd0})
-        self.sess.run(self.assign_target_soft)
+        with self.profiler.phase('reshape'):
+            batch=self.prepare(batch)
+        feed_dict={self.actor_net.state_vector:batch['vector0'], \
+                   self.actor_net.state_rgbd:batch['rgbd0'], \
+                   self.critic_net.action:batch['action0'], \
+                   self.vector1:batch['vector1'], \
+                   self.rgbd1:batch['rgbd1'], \
+                   self.reward:batch['reward'], \
+                   self.done:batch['done']}
+        if 'discount' in batch:
+            feed_dict[self.discount]=batch['discount']
+        if 'weights' in batch:
+            feed_dict[self.weights]=batch['weights']
+        with self.learn_lock:
+            self.updates+=1
+            soft=self.updates%self.target_update_every==0
+            if self.profile_phases:
+                td_error=self.learn_phases(feed_dict,soft)
+            else:
+                # a full update in one call
+                _,td_error=self.profiler.run(self.sess,'update', \
+                    [self.train_soft if soft else self.train,self.td_error],feed_dict=feed_dict)
+        self.profiler.step()
+        return np.reshape(td_error,[-1])
+
+    def learn_phases(self,feed_dict,soft=True):
+        # same update as learn() in one sess.run per phase. the actor
+        # gradients are computed with the critic before its update
+        target_q=self.profiler.run(self.sess,'target',self.target_q, \
+            feed_dict={self.vector1:feed_dict[self.vector1],self.rgbd1:feed_dict[self.rgbd1]})
+        feed_dict=dict(feed_dict)
+        feed_dict[self.target_q]=target_q
+        _,td_error,gradients=self.profiler.run(self.sess,'critic', \
+            [self.critic_step,self.td_error,self.actor_gradients],feed_dict=feed_dict)
+        self.profiler.run(self.sess,'actor',self.actor_step, \
+            feed_dict=dict(zip(self.actor_feed,gradients)))
+        if soft:
+            self.profiler.run(self.sess,'soft_update',self.soft_step)
+        return td_error
+
+    def stats(self):
+        # wall-clock time per learn() phase, see profiler.py
+        return self.profiler.stats()
+
+    def profile(self,trace_dir,steps,start=None):
+        # chrome traces of the next steps learn() calls
+        self.profiler.trace(trace_dir,self.profiler.steps if start is None else start,steps)
 
     def reset(self):
         self.sess.run(self.var_init)
     
     def load(self,saved_variables):
-        self.sess.run( \
-            [self.actor_net.variables[var].assign(saved_variables[var]) \
-                for var in self.actor_net.variables.keys()]+ \
-            [self.critic_net.variables[var].assign(saved_variables[var]) \
-                for var in self.critic_net.variables.keys()]+ \
-            self.assign_target)
+        # saved_variables: a dict of arrays or the path of a save()
+        if isinstance(saved_variables,str):
+            saved_variables=checkpoint.read(saved_variables)
+        with self.learn_lock:
+            self.checkpoint.restore(saved_variables)
+            self.sess.run(self.assign_target)
+        self.publish_actor()
     
     def return_variables(self):
-        return dict({name:self.sess.run(name) \
-                    for name in self.actor_net.variables.keys()}, \
-               **{name:self.sess.run(name) \
-                    for name in self.critic_net.variables.keys()})
+        with self.learn_lock:
+            return self.checkpoint.fetch()
+
+    def export_actor(self,path):
+        # actor (and shared encoder) weights plus architecture as one .npz,
+        # loaded by numpy_actor.NumpyActor without TensorFlow
+        var_list=self.actor_net.var_list+ \
+            (self.encoder_net.var_list if self.shared_encoder else [])
+        with self.learn_lock:
+            values=self.sess.run(var_list)
+        weights={var.name.split('/',1)[1].split(':')[0]:value \
+                 for var,value in zip(var_list,values)}
+        np.savez(path,architecture=json.dumps(self.architecture),**weights)
+
+    def save(self,path,wait=False):
+        # writes path.bin/path.json in the background, see checkpoint.py
+        self.checkpoint.save(path,wait=wait,values=self.return_variables())
 
 class Build_network(object):
 
-    def __init__(self,sess,config,name):
+    def __init__(self,sess,config,name,inputs={},params=None):
+        # inputs maps 'vector', 'rgbd' and (critic) 'action' to tensors
+        # used in place of new placeholders. an encoder_* network only holds
+        # the vector/rgbd layers and exposes their output as features, an
+        # actor/critic given inputs['features'] only holds the merge layers.
+        # params maps variable names to tensors used instead of creating
+        # variables
         self.name=name
         self.sess=sess
-        layers=copy.copy(config.layers)
-        self.trainable=False if name.split('_')[1]=='target' else True
+        layers=config.layers
+        self.trainable=name.split('_')[1]=='net'
+        encoder='features' not in inputs
+        head=name[0]!='e'
         with tf.name_scope(name):
-            self.state_vector=tf.placeholder(tf.float32,config.vector_dim)
-            self.state_rgbd=tf.placeholder(tf.float32,config.rgbd_dim)
-            layers['merge'][0][0]= \
-                    layers['rgbd'][-1][-1]* \
-                    config.rgbd_dim[1]* \
-                    config.rgbd_dim[2]/ \
-                    2**(2*len(layers['rgbd']))+ \
-                    layers['vector'][-1][-1]
-            if name[0]=='a':
+            self.state_vector=inputs['vector'] if 'vector' in inputs else \
+                tf.placeholder(tf.float32,config.vector_dim)
+            self.state_rgbd=inputs['rgbd'] if 'rgbd' in inputs else \
+                tf.placeholder(tf.uint8,config.rgbd_dim)
+            if not head:
+                pass
+            elif name[0]=='a':
                 # config.action_dim=len(config.action_bounds[0])
                 self.a_scale=tf.subtract(
                     config.action_bounds[0],config.action_bounds[1])/2.0
                 self.a_mean=tf.add(
                     config.action_bounds[0],config.action_bounds[1])/2.0
             else:
-                layers['merge'][0][0]+=config.action_dim
-                self.action=tf.placeholder(tf.float32,[None,config.action_dim])
-            for item in layers.keys():
-                for idx,shape in enumerate(layers[item]):
-                    self.create_variable(shape,item+str(idx))
-            if name[0]=='c':
-                self.create_variable([layers['merge'][-1][-1],1],'output')
+                self.action=inputs['action'] if 'action' in inputs else \
+                    tf.placeholder(tf.float32,[None,config.action_dim])
+            if params is None and encoder:
+                for idx,shape in enumerate(layers['vector']):
+                    self.create_variable(shape,'vector'+str(idx))
+                for idx,entry in enumerate(layers['rgbd']):
+                    kind,shape,options=rgbd_layer(entry)
+                    if kind=='conv':
+                        self.create_variable(shape,'rgbd'+str(idx))
+                    elif kind=='separable':
+                        self.create_separable(shape,options['multiplier'],'rgbd'+str(idx))
+            self.collect(params)
+            if encoder:
+                out_vector=self.state_vector
+                for layer in range(len(layers['vector'])):
+                    out_vector=self.fc(out_vector,'vector'+str(layer))
+                out_rgbd=normalize(self.state_rgbd,config.rgbd_scale)
+                for layer,entry in enumerate(layers['rgbd']):
+                    out_rgbd=self.conv(out_rgbd,'rgbd'+str(layer),entry)
+                # flatten size from the static shape of the encoder output
+                out_rgbd=tf.reshape(out_rgbd, \
+                    [-1,int(np.prod(out_rgbd.get_shape().as_list()[1:]))])
+                self.features=tf.concat([out_vector,out_rgbd],1)
             else:
-                self.create_variable([layers['merge'][-1][-1],config.action_dim],'output')
-            self.var_list=tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES,name)
-            self.variables={var.name:var for var in self.var_list}
-            out_vector=self.state_vector
-            for layer in range(len(layers['vector'])):
-                out_vector=self.fc(out_vector,'vector'+str(layer))
-            out_rgbd=self.state_rgbd
-            for layer in range(len(layers['rgbd'])):
-                out_rgbd=self.conv(out_rgbd,'rgbd'+str(layer))
-            out_rgbd=tf.reshape(out_rgbd, \
-                [
-                    -1,
-                    layers['rgbd'][-1][-1]* \
-                    config.rgbd_dim[1]* \
-                    config.rgbd_dim[2]/ \
-                    2**(2*len(layers['rgbd']))
-                ])
-            out_=tf.concat([out_vector,out_rgbd],1)
+                self.features=inputs['features']
+            if not head:
+                self.out_=self.features
+                return
+            if params is None:
+                merge=copy.deepcopy(layers['merge'])
+                merge[0][0]=int(self.features.get_shape()[1])
+                if name[0]=='c':
+                    merge[0][0]+=config.action_dim
+                for idx,shape in enumerate(merge):
+                    self.create_variable(shape,'merge'+str(idx))
+                if name[0]=='c':
+                    self.create_variable([merge[-1][-1],1],'output')
+                else:
+                    self.create_variable([merge[-1][-1],config.action_dim],'output')
+                self.collect(params)
+            out_=self.features
             if name[0]=='c':
                 out_=tf.concat([out_,self.action],1)
             for layer in range(len(layers['merge'])):
@@ -184,6 +388,15 @@ class Build_network(object):
             else:
                 self.out_=out_
 
+    def collect(self,params):
+        if params is None:
+            self.var_list=tf.get_collection(tf.GraphKeys.GLOBAL_VARIABLES,self.name)
+            self.variables={var.name:var for var in self.var_list}
+        else:
+            self.var_list=[]
+            self.variables={key:value for key,value in params.items() \
+                            if key.startswith(self.name+'/')}
+
     def evaluate(self,vector,rgbd,action=None):
         feed_dict={
                 self.state_vector:vector,
@@ -197,14 +410,30 @@ class Build_network(object):
             self.variables[self.name+'/'+layer+'/w:0'])+ \
             self.variables[self.name+'/'+layer+'/b:0'])
     
-    def conv(self,in_,layer):
+    def conv(self,in_,layer,entry):
+        # one config.layers['rgbd'] entry, see spec.py
+        kind,shape,options=rgbd_layer(entry)
+        if kind=='global_pool':
+            return tf.reduce_max(in_,[1,2]) if shape=='max' else tf.reduce_mean(in_,[1,2])
+        strides=[1,options['stride'],options['stride'],1]
+        if kind=='separable':
+            out_=tf.nn.separable_conv2d(
+                in_,
+                self.variables[self.name+'/'+layer+'/depthwise:0'],
+                self.variables[self.name+'/'+layer+'/pointwise:0'],
+                strides=strides,
+                padding='SAME')
+        else:
+            out_=tf.nn.conv2d(
+                in_,
+                self.variables[self.name+'/'+layer+'/f:0'],
+                strides=strides,
+                padding='SAME')
+        out_=tf.nn.relu(out_)
+        if not options['pool']:
+            return out_
         return tf.nn.max_pool(
-            tf.nn.relu(
-                tf.nn.conv2d(
-                    in_,
-                    self.variables[self.name+'/'+layer+'/f:0'],
-                    strides=[1,1,1,1],
-                    padding='SAME')),
+            out_,
             ksize=[1,2,2,1],
             strides=[1,2,2,1],
             padding='SAME')
@@ -222,6 +451,24 @@ class Build_network(object):
                 tf.Variable( \
                     tf.random_normal(shape,stddev=stddev),name='f',trainable=self.trainable)
 
+    def create_separable(self,shape,multiplier,name):
+        kh,kw,in_,out=shape
+        with tf.name_scope(name):
+            tf.Variable( \
+                tf.random_normal([kh,kw,in_,multiplier],stddev=1/np.sqrt(kh*kw)), \
+                name='depthwise',trainable=self.trainable)
+            tf.Variable( \
+                tf.random_normal([1,1,in_*multiplier,out],stddev=1/np.sqrt(in_*multiplier)), \
+                name='pointwise',trainable=self.trainable)
+
+
+def normalize(rgbd,scale):
+    # uint8 frames to float32 inside the graph
+    out_=tf.cast(rgbd,tf.float32)
+    return out_ if scale==1.0 else out_*scale
+
+def flatten(vars):
+    return tf.concat([tf.reshape(var,[-1]) for var in vars],0)
 
 def l2_regularizer(vars):
     loss=0
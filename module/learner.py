@@ -0,0 +1,63 @@
+import threading
+
+class AsyncLearner(object):
+    '''
+    Runs DDPG updates on a background thread so that the acting loop and
+    the learner do not wait for each other. The acting loop reports its
+    env steps with step(); the learner keeps at most ratio updates per
+    reported step (ratio<=0 learns as fast as it can) and publishes the
+    actor to the behaviour actor used by chooseAction every publish_every
+    updates. Build the DDPG with config.async_learner, otherwise the
+    actions are computed from weights that are being updated.
+    '''
+
+    def __init__(self,ddpg,memory,sampler=None,ratio=1.0,publish_every=100):
+        self.ddpg=ddpg
+        self.memory=memory
+        self.sampler=sampler
+        self.ratio=ratio
+        self.publish_every=publish_every
+        self.steps=0
+        self.updates=0
+        self.error=None
+        self.condition=threading.Condition()
+        self.running=True
+        self.thread=threading.Thread(target=self.run)
+        self.thread.daemon=True
+        self.thread.start()
+
+    def ready(self):
+        if self.memory.count==0:
+            return False
+        return self.ratio<=0 or self.updates<self.ratio*self.steps
+
+    def run(self):
+        try:
+            while self.running:
+                with self.condition:
+                    if not self.ready():
+                        self.condition.wait(0.01)
+                        continue
+                batch=self.sampler.get() if self.sampler is not None else self.memory.batch()
+                td_error=self.ddpg.learn(batch)
+                if 'indices' in batch:
+                    self.memory.update_priorities(batch['indices'],td_error)
+                self.updates+=1
+                if self.updates%self.publish_every==0:
+                    self.ddpg.publish_actor()
+        except Exception as e:
+            self.error=e
+            raise
+
+    def step(self,n=1):
+        # report n env steps, raises if the learner thread died
+        if self.error is not None:
+            raise self.error
+        with self.condition:
+            self.steps+=n
+            self.condition.notify()
+
+    def close(self):
+        self.running=False
+        self.thread.join()
+        self.ddpg.publish_actor()
@@ -0,0 +1,94 @@
+import json
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from .spec import rgbd_layer
+
+class NumpyActor(object):
+    '''
+    Forward pass of an actor exported with DDPG.export_actor, in NumPy only,
+    so that evaluation and the robot do not need TensorFlow or the critics.
+    '''
+
+    def __init__(self,path):
+        data=np.load(path)
+        self.architecture=json.loads(str(data['architecture']))
+        self.weights={key:data[key].astype(np.float32) \
+                      for key in data.files if key!='architecture'}
+        layers=self.architecture['layers']
+        self.n_vector=len(layers['vector'])
+        self.rgbd_layers=layers['rgbd']
+        self.n_merge=len(layers['merge'])
+        self.rgbd_dim=[-1]+self.architecture['rgbd_dim']
+        bounds=np.array(self.architecture['action_bounds'],dtype=np.float32)
+        self.a_scale=(bounds[0]-bounds[1])/2.0
+        self.a_mean=(bounds[0]+bounds[1])/2.0
+
+    def evaluate(self,vector,rgbd):
+        out_vector=np.reshape(vector,[len(vector),-1]).astype(np.float32)
+        for layer in range(self.n_vector):
+            out_vector=self.fc(out_vector,'vector'+str(layer))
+        out_rgbd=np.reshape(rgbd,self.rgbd_dim).astype(np.float32)
+        if self.architecture['rgbd_scale']!=1.0:
+            out_rgbd*=self.architecture['rgbd_scale']
+        for layer,entry in enumerate(self.rgbd_layers):
+            out_rgbd=self.conv(out_rgbd,'rgbd'+str(layer),entry)
+        out_=np.concatenate([out_vector,out_rgbd.reshape([len(out_rgbd),-1])],1)
+        for layer in range(self.n_merge):
+            out_=self.fc(out_,'merge'+str(layer))
+        out_=np.dot(out_,self.weights['output/w'])
+        return np.tanh(out_)*self.a_scale+self.a_mean
+
+    def chooseAction(self,state):
+        # greedy action of a single state
+        action=self.evaluate(np.reshape(state['vector'],[1,-1]),state['rgbd'])
+        return np.reshape(action,[-1])
+
+    def fc(self,in_,layer):
+        return relu(np.dot(in_,self.weights[layer+'/w'])+self.weights[layer+'/b'])
+
+    def conv(self,in_,layer,entry):
+        # one config.layers['rgbd'] entry, see spec.py
+        kind,shape,options=rgbd_layer(entry)
+        if kind=='global_pool':
+            return in_.max(axis=(1,2)) if shape=='max' else in_.mean(axis=(1,2))
+        if kind=='separable':
+            out_=depthwise_conv2d(in_,self.weights[layer+'/depthwise'],options['stride'])
+            out_=conv2d(out_,self.weights[layer+'/pointwise'],1)
+        else:
+            out_=conv2d(in_,self.weights[layer+'/f'],options['stride'])
+        out_=relu(out_)
+        return max_pool(out_) if options['pool'] else out_
+
+def relu(x):
+    return np.maximum(x,0,out=x)
+
+def windows(x,kh,kw,stride):
+    # [n,oh,ow,kh,kw,c] view of the SAME padded kh x kw patches
+    n,h,w,c=x.shape
+    oh,ow=-(-h//stride),-(-w//stride)
+    ph=max((oh-1)*stride+kh-h,0)
+    pw=max((ow-1)*stride+kw-w,0)
+    x=np.pad(x,[(0,0),(ph//2,ph-ph//2),(pw//2,pw-pw//2),(0,0)],'constant')
+    s=x.strides
+    return as_strided(x,[n,oh,ow,kh,kw,c], \
+                      [s[0],s[1]*stride,s[2]*stride,s[1],s[2],s[3]])
+
+def conv2d(x,f,stride):
+    # SAME padding, as an im2col matrix product
+    kh,kw,c,o=f.shape
+    cols=windows(x,kh,kw,stride)
+    n,oh,ow=cols.shape[:3]
+    return np.dot(cols.reshape([n*oh*ow,kh*kw*c]),f.reshape([kh*kw*c,o])).reshape([n,oh,ow,o])
+
+def depthwise_conv2d(x,f,stride):
+    # f [kh,kw,c,multiplier], output channel c*multiplier+m as in TF
+    kh,kw,c,m=f.shape
+    out_=np.einsum('nhwijc,ijcm->nhwcm',windows(x,kh,kw,stride),f)
+    return out_.reshape(out_.shape[:3]+(c*m,))
+
+def max_pool(x):
+    # 2x2 window, stride 2, SAME padding
+    n,h,w,c=x.shape
+    x=np.pad(x,[(0,0),(0,h%2),(0,w%2),(0,0)],'constant',constant_values=-np.inf)
+    return x.reshape([n,(h+1)//2,2,(w+1)//2,2,c]).max(axis=(2,4))
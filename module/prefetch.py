@@ -0,0 +1,57 @@
+import time
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+class Prefetcher(object):
+    '''
+    Draws batches from a Replay on a background thread and keeps up to depth
+    of them ready in a bounded queue, so sampling and the conversion done by
+    prepare (e.g. DDPG.prepare) overlap with the simulator step.
+    get() returns the oldest ready batch; the transitions it holds may be up
+    to depth batches older than the latest add(). an exception raised by
+    batch() or prepare stops the thread and is raised again by get().
+    '''
+
+    def __init__(self,memory,prepare=None,depth=4):
+        self.memory=memory
+        self.prepare=prepare
+        self.queue=queue.Queue(maxsize=depth)
+        self.running=True
+        self.error=None
+        self.thread=threading.Thread(target=self.run)
+        self.thread.daemon=True
+        self.thread.start()
+
+    def run(self):
+        try:
+            while self.running:
+                if self.memory.count==0:
+                    time.sleep(0.01)
+                    continue
+                batch=self.memory.batch()
+                if self.prepare is not None:
+                    batch=self.prepare(batch)
+                while self.running:
+                    try:
+                        self.queue.put(batch,timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+        except Exception as e:
+            self.error=e
+            raise
+
+    def get(self):
+        while True:
+            try:
+                return self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.error is not None:
+                    raise self.error
+
+    def close(self):
+        self.running=False
+        self.thread.join()
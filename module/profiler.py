@@ -0,0 +1,69 @@
+import os
+import time
+import contextlib
+import tensorflow as tf
+from tensorflow.python.client import timeline
+
+class Profiler(object):
+    '''
+    Wall-clock totals per named phase, always on, and opt-in TF run
+    metadata: every sess.run made through run() during the trace_steps
+    steps starting at step trace_start is written to trace_dir as a Chrome
+    trace (chrome://tracing), one file per step and phase.
+    '''
+
+    def __init__(self,trace_dir=None,trace_start=0,trace_steps=0):
+        self.totals={}
+        self.counts={}
+        self.steps=0
+        self.trace(trace_dir,trace_start,trace_steps)
+
+    def trace(self,trace_dir,start,steps):
+        self.trace_dir=trace_dir
+        self.trace_start=start
+        self.trace_steps=steps
+        if trace_dir is not None and steps>0 and not os.path.isdir(trace_dir):
+            os.makedirs(trace_dir)
+
+    def tracing(self):
+        return self.trace_dir is not None and \
+            self.trace_start<=self.steps<self.trace_start+self.trace_steps
+
+    def add(self,name,seconds):
+        self.totals[name]=self.totals.get(name,0.0)+seconds
+        self.counts[name]=self.counts.get(name,0)+1
+
+    @contextlib.contextmanager
+    def phase(self,name):
+        start=time.time()
+        yield
+        self.add(name,time.time()-start)
+
+    def run(self,sess,name,fetches,feed_dict=None):
+        start=time.time()
+        if self.tracing():
+            options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+            metadata=tf.RunMetadata()
+            out=sess.run(fetches,feed_dict=feed_dict,options=options,run_metadata=metadata)
+            self.add(name,time.time()-start)
+            trace=timeline.Timeline(metadata.step_stats).generate_chrome_trace_format()
+            with open(os.path.join(self.trace_dir,'step%06d_%s.json'%(self.steps,name)),'w') as f:
+                f.write(trace)
+        else:
+            out=sess.run(fetches,feed_dict=feed_dict)
+            self.add(name,time.time()-start)
+        return out
+
+    def step(self):
+        self.steps+=1
+
+    def stats(self):
+        # phase -> count, total and mean seconds
+        return {name:{'count':self.counts[name], \
+                      'total':self.totals[name], \
+                      'mean':self.totals[name]/self.counts[name]} \
+                for name in self.totals.keys()}
+
+    def reset(self):
+        self.totals={}
+        self.counts={}
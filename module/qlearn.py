@@ -1,51 +1,367 @@
+import json
+import zlib
 import random
+import struct
+import multiprocessing
+import numpy as np
+
+from .replay import shared_array
+
+# checkpoint layout: MAGIC, uint64 header size, json header, newline
+# separated state keys in row order, then the float32 Q-values and the
+# uint8 visited flags as C ordered [n_states, n_actions] matrices, each
+# aligned to ALIGN bytes so that they can be memory-mapped in place
+MAGIC = b'QTABLE01'
+ALIGN = 64
 
 class QLearn:
-    def __init__(self, actions, epsilon, alpha, gamma):
-        self.q = {}
+    def __init__(self, actions, epsilon, alpha, gamma, capacity=1024,
+                 lambd=0.0, trace_cutoff=1e-3, max_traces=10000):
         self.epsilon = epsilon  # exploration constant
         self.alpha = alpha      # discount constant
         self.gamma = gamma      # discount factor
-        self.actions = actions
+        # Watkins Q(lambda) when lambd > 0. eligibility traces are kept only
+        # for recently visited pairs: as flat row * n_actions + column keys
+        # and values, dropped below trace_cutoff and capped at max_traces
+        self.lambd = lambd
+        self.trace_cutoff = trace_cutoff
+        self.max_traces = max_traces
+        self.trace_keys = np.zeros(0, dtype=np.int64)
+        self.trace_values = np.zeros(0, dtype=np.float64)
+        self.actions = list(actions)
+        self.action_index = {a: i for i, a in enumerate(self.actions)}
+        # every state is interned to a row of the Q-table,
+        # visited marks the (state, action) pairs updated at least once
+        self.states = {}
+        self.q = np.zeros([capacity, len(self.actions)], dtype=np.float32)
+        self.visited = np.zeros([capacity, len(self.actions)], dtype=bool)
+
+    def intern(self, state):
+        idx = self.states.get(state)
+        if idx is None:
+            idx = len(self.states)
+            if idx == len(self.q):
+                self.grow(2 * len(self.q))
+            self.states[state] = idx
+        return idx
+
+    def grow(self, capacity):
+        q = np.zeros([capacity, len(self.actions)], dtype=np.float32)
+        visited = np.zeros([capacity, len(self.actions)], dtype=bool)
+        q[:len(self.q)] = self.q
+        visited[:len(self.visited)] = self.visited
+        self.q, self.visited = q, visited
+
+    def lookup(self, state):
+        # row of a state, None if it was never interned
+        return self.states.get(state)
 
     def getQ(self, state, action):
-        return self.q.get((state, action), 0.0)
+        idx = self.lookup(state)
+        if idx is None:
+            return 0.0
+        return float(self.q[idx, self.action_index[action]])
+
+    def getRow(self, state):
+        idx = self.lookup(state)
+        if idx is None:
+            return np.zeros(len(self.actions))
+        return self.q[idx].astype(np.float64)
 
     def learnQ(self, state, action, reward, value):
         '''
         Q-learning:
-            Q(s, a) += alpha * (reward(s,a) + max(Q(s') - Q(s,a))            
+            Q(s, a) += alpha * (reward(s,a) + max(Q(s') - Q(s,a))
         '''
-        oldv = self.q.get((state, action), None)
-        if oldv is None:
-            self.q[(state, action)] = reward
+        idx = self.intern(state)
+        a = self.action_index[action]
+        if not self.visited[idx, a]:
+            self.q[idx, a] = reward
+            self.visited[idx, a] = True
         else:
-            self.q[(state, action)] = oldv + self.alpha * (value - oldv)
+            self.q[idx, a] += self.alpha * (value - self.q[idx, a])
 
     def chooseAction(self, state, return_q=False):
-        q = [self.getQ(state, a) for a in self.actions]
-        maxQ = max(q)
+        q = self.getRow(state)
+        maxQ = q.max()
 
         if random.random() < self.epsilon:
-            minQ = min(q); mag = max(abs(minQ), abs(maxQ))
+            minQ = q.min(); mag = max(abs(minQ), abs(maxQ))
             # add random values to all the actions, recalculate maxQ
-            q = [q[i] + random.random() * mag - .5 * mag for i in range(len(self.actions))] 
-            maxQ = max(q)
+            q = q + np.random.random(len(self.actions)) * mag - .5 * mag
+            maxQ = q.max()
 
-        count = q.count(maxQ)
-        # In case there're several state-action max values 
+        # In case there're several state-action max values
         # we select a random one among them
-        if count > 1:
-            best = [i for i in range(len(self.actions)) if q[i] == maxQ]
-            i = random.choice(best)
-        else:
-            i = q.index(maxQ)
+        best = np.flatnonzero(q == maxQ)
+        i = random.choice(best) if len(best) > 1 else best[0]
 
-        action = self.actions[i]        
+        # Watkins Q(lambda): an exploratory action ends the credit chain
+        if self.lambd > 0 and len(self.trace_keys):
+            row = self.getRow(state)
+            if row[i] != row.max():
+                self.resetTraces()
+
+        action = self.actions[i]
         if return_q: # if they want it, give it!
-            return action, q
+            return action, q.tolist()
         return action
 
     def learn(self, state1, action1, reward, state2):
-        maxqnew = max([self.getQ(state2, a) for a in self.actions])
-        self.learnQ(state1, action1, reward, reward + self.gamma*maxqnew)
\ No newline at end of file
+        maxqnew = self.getRow(state2).max()
+        if self.lambd > 0:
+            self.learnTrace(state1, action1, reward + self.gamma*maxqnew)
+        else:
+            self.learnQ(state1, action1, reward, reward + self.gamma*maxqnew)
+
+    def learnTrace(self, state, action, value):
+        '''
+        Q(lambda):
+            delta = reward(s,a) + gamma * max(Q(s')) - Q(s,a)
+            e(s,a) += 1
+            Q += alpha * delta * e, then e *= gamma * lambda
+        over the active traces only.
+        '''
+        idx = self.intern(state)
+        a = self.action_index[action]
+        delta = value - float(self.q[idx, a])
+        key = idx * len(self.actions) + a
+        pos = np.flatnonzero(self.trace_keys == key)
+        if len(pos):
+            self.trace_values[pos[0]] += 1.0
+        else:
+            self.trace_keys = np.append(self.trace_keys, key)
+            self.trace_values = np.append(self.trace_values, 1.0)
+        rows, cols = np.divmod(self.trace_keys, len(self.actions))
+        self.q[rows, cols] += self.alpha * delta * self.trace_values
+        self.visited[idx, a] = True
+        self.trace_values *= self.gamma * self.lambd
+        keep = self.trace_values >= self.trace_cutoff
+        if keep.sum() > self.max_traces:
+            keep[:] = False
+            keep[np.argpartition(-self.trace_values, self.max_traces)[:self.max_traces]] = True
+        self.trace_keys = self.trace_keys[keep]
+        self.trace_values = self.trace_values[keep]
+
+    def resetTraces(self):
+        # call at the start of every episode
+        self.trace_keys = np.zeros(0, dtype=np.int64)
+        self.trace_values = np.zeros(0, dtype=np.float64)
+
+    def stateKeys(self):
+        # state strings ordered by their row id
+        keys = [None] * len(self.states)
+        for state, idx in self.states.items():
+            keys[idx] = state
+        return keys
+
+    def learnBatch(self, states, actions, rewards, next_states, dones=None, sweeps=1):
+        '''
+        Q-learning sweeps over logged transitions given as arrays of state
+        ids (see intern), action indices into self.actions, rewards, next
+        state ids and done flags. Within a sweep all targets are computed
+        from the table as it was at the start of the sweep; the updates of
+        a (state, action) pair that occurs several times are then applied
+        in log order, exactly as repeated learnQ calls with those targets
+        would, so duplicates neither overwrite nor double count each other.
+        Returns the largest absolute change of each sweep.
+        '''
+        states = np.asarray(states, dtype=np.int64)
+        actions = np.asarray(actions, dtype=np.int64)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        next_states = np.asarray(next_states, dtype=np.int64)
+        dones = np.zeros(len(states), dtype=bool) if dones is None \
+            else np.asarray(dones, dtype=bool)
+        n = len(self.actions)
+        # group the log by (state, action), keeping log order in each group
+        order = np.argsort(states * n + actions, kind='mergesort')
+        key = (states * n + actions)[order]
+        first = np.concatenate([[True], key[1:] != key[:-1]])
+        group = np.cumsum(first) - 1
+        starts = np.flatnonzero(first)
+        counts = np.diff(np.append(starts, len(key)))
+        rank = np.arange(len(key)) - starts[group]
+        s, a = states[order][starts], actions[order][starts]
+        changes = []
+        for sweep in range(sweeps):
+            targets = rewards[order] + self.gamma * \
+                (1.0 - dones[order]) * self.q[next_states[order]].max(axis=1)
+            # an unvisited pair takes the reward of its first update as is
+            visited = self.visited[s, a]
+            skip = (~visited).astype(np.int64)
+            applied = rank >= skip[group]
+            later = counts[group] - 1 - rank
+            weights = np.where(applied, self.alpha * (1.0 - self.alpha) ** later, 0.0)
+            base = np.where(visited, self.q[s, a], rewards[order][starts])
+            new = base * (1.0 - self.alpha) ** (counts - skip) + \
+                np.bincount(group, weights=weights * targets, minlength=len(starts))
+            changes.append(float(np.abs(new - self.q[s, a]).max()) if len(s) else 0.0)
+            self.q[s, a] = new
+            self.visited[s, a] = True
+        return changes
+
+    def save(self, filename):
+        keys = self.stateKeys()
+        if any('\n' in key for key in keys):
+            raise ValueError('state keys must not contain newlines')
+        blob = '\n'.join(keys).encode('utf-8')
+        n = len(keys)
+        header = {'n_states': n, 'n_actions': len(self.actions),
+                  'actions': self.actions, 'epsilon': self.epsilon,
+                  'alpha': self.alpha, 'gamma': self.gamma, 'lambd': self.lambd,
+                  'keys_size': len(blob)}
+        # offsets depend on the header size, so settle them iteratively
+        header['q_offset'] = header['visited_offset'] = 0
+        while True:
+            encoded = json.dumps(header, sort_keys=True).encode('utf-8')
+            q_offset = aligned(16 + len(encoded) + len(blob))
+            visited_offset = aligned(q_offset + 4 * n * len(self.actions))
+            if (header['q_offset'], header['visited_offset']) == (q_offset, visited_offset):
+                break
+            header['q_offset'], header['visited_offset'] = q_offset, visited_offset
+        with open(filename, 'wb') as f:
+            f.write(MAGIC + struct.pack('<Q', len(encoded)) + encoded + blob)
+            f.write(b'\0' * (q_offset - f.tell()))
+            f.write(np.ascontiguousarray(self.q[:n], dtype='<f4').tobytes())
+            f.write(b'\0' * (visited_offset - f.tell()))
+            f.write(np.ascontiguousarray(self.visited[:n], dtype=np.uint8).tobytes())
+
+    @classmethod
+    def load(cls, filename, mmap_mode='r'):
+        '''
+        Load a table written by save. With mmap_mode='r' the values are a
+        read-only memory map shared by every process that loads the file:
+        good for evaluation, learning on it raises. 'c' maps it copy-on-write
+        for private learning, None reads it into memory.
+        '''
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(filename + ' is not a Q-table checkpoint')
+            size, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(size).decode('utf-8'))
+            keys = f.read(header['keys_size']).decode('utf-8')
+        self = cls(header['actions'], header['epsilon'], header['alpha'],
+                   header['gamma'], capacity=1, lambd=header.get('lambd', 0.0))
+        n = header['n_states']
+        shape = (n, len(self.actions))
+        keys = keys.split('\n') if n else []
+        self.states = dict(zip(keys, range(n)))
+        if mmap_mode is None or n == 0:
+            with open(filename, 'rb') as f:
+                f.seek(header['q_offset'])
+                self.q = np.fromfile(f, dtype='<f4', count=shape[0] * shape[1]).reshape(shape)
+                f.seek(header['visited_offset'])
+                self.visited = np.fromfile(f, dtype=np.uint8, count=shape[0] * shape[1]) \
+                    .reshape(shape).astype(bool)
+            if n == 0:
+                self.grow(1)
+        else:
+            self.q = np.memmap(filename, dtype='<f4', mode=mmap_mode,
+                               offset=header['q_offset'], shape=shape)
+            self.visited = np.memmap(filename, dtype=np.bool_, mode=mmap_mode,
+                                     offset=header['visited_offset'], shape=shape)
+        return self
+
+
+class SharedQLearn(QLearn):
+    '''
+    QLearn whose table lives in shared memory, so that worker processes
+    forked after its creation all learn into the same Q-table.
+    States are interned in a fixed size open addressing hash table of
+    capacity rows (a power of two) that stores the state strings, at most
+    key_size bytes each; it does not grow.
+
+    Consistency model:
+      - keys are only written under one lock shared by all processes.
+        the first lookup of a state in a process probes without the lock
+        and, if that finds the key, probes again under the lock before
+        the row is cached: a lock-free probe can read a key while it is
+        being copied (b'12' of '123') and match the wrong state. interning
+        a state the lock-free probe missed also probes under the lock, so
+        a state always maps to a single row. each process caches its rows
+        in self.states, so the lock is only taken for states new to it.
+      - Q-values and visited flags are read and written without locks
+        (Hogwild). two workers updating the same entry at the same moment
+        can lose one of the updates; aligned float32 stores do not tear.
+        with states spread over many rows such collisions are rare and
+        tabular Q-learning tolerates them.
+      - epsilon and the Q(lambda) traces are per process.
+    '''
+
+    def __init__(self, actions, epsilon, alpha, gamma, capacity=1 << 18,
+                 key_size=64, **kwargs):
+        QLearn.__init__(self, actions, epsilon, alpha, gamma, capacity=1, **kwargs)
+        size = 1
+        while size < capacity:
+            size *= 2
+        self.keys = shared_array([size], 'S%d' % key_size)
+        self.q = shared_array([size, len(self.actions)], np.float32)
+        self.visited = shared_array([size, len(self.actions)], np.bool_)
+        self.used = shared_array([1], np.int64)
+        self.lock = multiprocessing.Lock()
+
+    def probe(self, key):
+        # first row holding key or the empty row where it would go
+        mask = len(self.keys) - 1
+        idx = zlib.crc32(key) & mask
+        for _ in range(len(self.keys)):
+            found = self.keys[idx]
+            if found == key or found == b'':
+                return idx, found == key
+            idx = (idx + 1) & mask
+        return None, False
+
+    def lookup(self, state):
+        idx = self.states.get(state)
+        if idx is None:
+            key = state.encode('utf-8')
+            idx, found = self.probe(key)
+            if not found:
+                return None
+            # confirm the hit, the key may have been read half written
+            with self.lock:
+                idx, found = self.probe(key)
+            if not found:
+                return None
+            self.states[state] = idx
+        return idx
+
+    def intern(self, state):
+        idx = self.lookup(state)
+        if idx is None:
+            key = state.encode('utf-8')
+            if len(key) > self.keys.dtype.itemsize:
+                raise ValueError('state longer than key_size: ' + state)
+            with self.lock:
+                idx, found = self.probe(key)
+                if idx is None or (not found and 2 * self.used[0] >= len(self.keys)):
+                    raise RuntimeError('shared Q-table is full')
+                if not found:
+                    self.keys[idx] = key
+                    self.used[0] += 1
+            self.states[state] = idx
+        return idx
+
+    def grow(self, capacity):
+        raise RuntimeError('shared Q-table cannot grow')
+
+    def stateKeys(self):
+        # state strings ordered by their row id, '' for the empty rows
+        return [key.decode('utf-8') for key in self.keys]
+
+    def snapshot(self):
+        # private QLearn copy of every state in the shared table
+        rows = np.flatnonzero(self.keys != b'')
+        table = QLearn(self.actions, self.epsilon, self.alpha, self.gamma,
+                       capacity=max(len(rows), 1), lambd=self.lambd)
+        table.states = {key.decode('utf-8'): i for i, key in enumerate(self.keys[rows])}
+        table.q[:len(rows)] = self.q[rows]
+        table.visited[:len(rows)] = self.visited[rows]
+        return table
+
+    def save(self, filename):
+        self.snapshot().save(filename)
+
+
+def aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
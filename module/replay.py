@@ -1,46 +1,737 @@
+import os
+import json
+import mmap
+import zlib
+import threading
+import numpy as np
 from numpy import random
+from collections import OrderedDict
+from numpy.lib.format import open_memmap
+from multiprocessing.pool import ThreadPool
+
+# default layout of the observations produced by the gazebo environments,
+# name:(shape,dtype). shapes exclude the leading buffer dimension.
+SCHEMA={
+    'vector':([42],np.float32),
+    'rgbd':([96,128,7],np.uint8),
+    'lidar':([36],np.float32),
+    'proximity':([4],np.float32),
+    'control':([3],np.float32)
+}
 
 class Replay(object):
-    
-    def __init__(self,max_buffer,batch_size,observations=False):
-        self.max_buffer=max_buffer
+    '''
+    Ring buffer of transitions backed by one preallocated numpy array per key.
+    Observations are stored once per slot: a transition in slot i reads its
+    *0 observations from slot i and its *1 observations from slot i+1, so
+    consecutive transitions of an episode share frames. add() detects the
+    continuation when the *0 observations of an experience are the very
+    objects passed as *1 in the previous one (state0=state1 in the run loop)
+    or, failing that, equal to them (a copy or conversion by the caller).
+    An episode of n transitions takes n+1 slots; slots whose successor does
+    not hold their next observation are marked invalid and never sampled.
+    The transitions of every episode in the buffer are indexed by episode id
+    (see episodes()) for sample_sequences().
+        observations: list of observation names found in SCHEMA, or a dict
+                      {name:(shape,dtype)} declaring the layout explicitly.
+        path: directory for a persistent buffer. every key is then stored in
+              memory-mapped segment files (see Segments) and only the rows
+              written by add() touch the disk. sync() records the cursor so
+              the buffer can be reopened with load=True; otherwise the
+              buffer starts empty and clears what it finds in path.
+        prioritized: sample transitions proportionally to priority**alpha
+                     (kept in a SumTree) and return importance sampling
+                     'weights' and the sampled 'indices' with each batch.
+                     feed the TD errors back with update_priorities().
+        compress: keep the rgbd observations zlib compressed per frame (see
+                  Compressed); batch() decodes only the sampled frames on
+                  a pool of workers threads. not available with path.
+        n_step: return n-step transitions: 'reward' is the discounted sum of
+                up to n_step rewards of the episode, *1 and 'done' are taken
+                after the last of them and 'discount' holds gamma**k for the
+                k steps actually summed. computed at sample time.
+        buffer: preallocated storage {key:array} matching the schema, used
+                instead of allocating it (see SharedReplay).
+    '''
+
+    def __init__(self,max_buffer,batch_size,observations=False,action_dim=3, \
+                 path=None,load=False,segment_size=10000, \
+                 prioritized=False,alpha=0.6,beta=0.4,epsilon=1e-6, \
+                 compress=False,workers=4,n_step=1,gamma=0.9,buffer=None):
+        self.max_buffer=int(max_buffer)
         self.batch_size=batch_size
-        self.currentPosition=-1
+        self.path=path
+        self.n_step=n_step
+        self.gamma=gamma
+        self.currentPosition=0
         if not observations:
-            observations=['vector0','rgbd0']
-        self.bufferkeys=[key+'0' for key in observations]+ \
-                        [key+'1' for key in observations]+ \
+            observations=['vector','rgbd']
+        if not isinstance(observations,dict):
+            observations={key:SCHEMA[key] for key in observations}
+        self.observations=list(observations.keys())
+        self.schema={}
+        for key,(shape,dtype) in observations.items():
+            self.schema[key]=(list(shape),dtype)
+        self.schema['action0']=([action_dim],np.float32)
+        self.schema['reward']=([],np.float32)
+        self.schema['done']=([],np.bool_)
+        self.schema['valid']=([],np.bool_)
+        self.schema['episode']=([],np.int64)
+        # value of written when the slot was last overwritten
+        self.schema['sequence']=([],np.int64)
+        self.bufferkeys=[key+'0' for key in self.observations]+ \
+                        [key+'1' for key in self.observations]+ \
                         ['action0','reward','done']
-        self.buffer={key:[] for key in self.bufferkeys}
         self.buffersize=0
+        self.count=0
         self.max=False
+        # slot holding the last *1 observations while the episode is running
+        self.pending=None
+        self.last={}
+        # episode id:[first slot,number of transitions], oldest first
+        self.index=OrderedDict()
+        self.episode=0
+        # number of slots overwritten so far
+        self.written=0
+        # add() and batch() may run on different threads (see prefetch)
+        self.lock=threading.Lock()
+        self.prioritized=prioritized
+        if prioritized:
+            self.alpha=alpha
+            self.beta=beta
+            self.epsilon=epsilon
+            self.max_priority=1.0
+            self.tree=SumTree(self.max_buffer)
+        if compress and path is not None:
+            raise ValueError('compressed storage cannot be persisted')
+        if buffer is not None:
+            self.buffer=buffer
+        elif path is None:
+            self.buffer={key:np.zeros([self.max_buffer]+shape,dtype=dtype) \
+                         for key,(shape,dtype) in self.schema.items()}
+            if compress:
+                pool=ThreadPool(workers)
+                for key in self.observations:
+                    if key.startswith('rgbd'):
+                        shape,dtype=self.schema[key]
+                        self.buffer[key]=Compressed(self.max_buffer,shape,dtype,pool=pool)
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.buffer={key:Segments(path,key,self.max_buffer,shape,dtype,segment_size) \
+                         for key,(shape,dtype) in self.schema.items()}
+            if not (load and self.load()):
+                # segment files left in path by an earlier run must not
+                # be taken for transitions
+                self.clear()
 
     def batch(self):
-        if self.buffersize>self.batch_size:
-            indices=random.choice(range(self.buffersize),self.batch_size,replace=False)
-            Batch={key:[] for key in self.buffer.keys()}
-            for key in self.buffer.keys():
-                for idx in indices:
-                    Batch[name].append(self.buffer[name][idx])
-            return Batch
-        else:
-            return self.buffer
+        # the slots are picked under the lock and read outside it, so add()
+        # is not held up by segment reads or frame decoding. rows that add()
+        # overwrote in the meantime are replaced under the lock.
+        with self.lock:
+            full=self.count>self.batch_size
+            if not full:
+                indices=np.flatnonzero(self.buffer['valid'][:self.buffersize])
+            elif self.prioritized:
+                indices=self.prioritized_sample()
+            else:
+                indices=self.sample()
+            written=self.written
+        Batch=self.gather(indices)
+        with self.lock:
+            torn=self.overwritten(indices,written)
+            if torn.any() and full:
+                kept=indices[~torn]
+                fresh=self.sample()
+                indices[torn]=fresh[~np.isin(fresh,kept)][:torn.sum()]
+                again=self.gather(indices[torn])
+                for key in Batch.keys():
+                    Batch[key][torn]=again[key]
+            elif torn.any():
+                indices=indices[~torn]
+                Batch={key:value[~torn] for key,value in Batch.items()}
+            if full and self.prioritized:
+                Batch['weights']=self.weights(indices)
+                Batch['indices']=indices
+        return Batch
+
+    def overwritten(self,indices,written):
+        # a transition reads the slots i..i+n_step, see gather_n_step
+        slots=(indices[:,None]+np.arange(self.n_step+1))%self.max_buffer
+        sequence=self.buffer['sequence'][slots.reshape(-1)].reshape(slots.shape)
+        return (sequence>written).any(axis=1)
+
+    def sample(self,batch_size=None):
+        # uniform over valid slots without replacement. drawn by rejection,
+        # invalid slots are rare: repeated and invalid candidates are dropped
+        # in draw order until batch_size distinct valid slots are left
+        if batch_size is None:
+            batch_size=self.batch_size
+        if batch_size>=self.count:
+            return random.permutation( \
+                np.flatnonzero(self.buffer['valid'][:self.buffersize]))[:batch_size]
+        indices=np.zeros(0,dtype=np.int64)
+        while len(indices)<batch_size:
+            candidates=random.randint(0,self.buffersize,2*batch_size)
+            indices=np.concatenate( \
+                [indices,candidates[self.buffer['valid'][candidates]]])
+            _,first=np.unique(indices,return_index=True)
+            indices=indices[np.sort(first)]
+        return indices[:batch_size]
+
+    def gather(self,indices):
+        if self.n_step>1:
+            return self.gather_n_step(indices)
+        following=(indices+1)%self.max_buffer
+        Batch={}
+        for key in self.observations:
+            Batch[key+'0']=self.buffer[key][indices]
+            Batch[key+'1']=self.buffer[key][following]
+        for key in ['action0','reward','done']:
+            Batch[key]=self.buffer[key][indices]
+        return Batch
+
+    def gather_n_step(self,indices):
+        # step m of transition i lives in slot i+m. it is part of the return
+        # if step m-1 was and was not done and slot i+m holds a transition,
+        # which can only continue the episode: the slot after a truncated
+        # episode or the newest observation is never valid.
+        shape=[len(indices),self.n_step]
+        slots=(indices[:,None]+np.arange(self.n_step))%self.max_buffer
+        valid=self.buffer['valid'][slots.reshape(-1)].reshape(shape)
+        done=self.buffer['done'][slots.reshape(-1)].reshape(shape)
+        reward=self.buffer['reward'][slots.reshape(-1)].reshape(shape)
+        included=np.cumprod(np.concatenate( \
+            [valid[:,:1],valid[:,1:]&~done[:,:-1]],axis=1),axis=1).astype(bool)
+        steps=included.sum(axis=1)
+        last=slots[np.arange(len(indices)),steps-1]
+        following=(indices+steps)%self.max_buffer
+        Batch={}
+        for key in self.observations:
+            Batch[key+'0']=self.buffer[key][indices]
+            Batch[key+'1']=self.buffer[key][following]
+        Batch['action0']=self.buffer['action0'][indices]
+        Batch['reward']=np.sum(reward*included*self.gamma**np.arange(self.n_step),axis=1) \
+            .astype(np.float32)
+        Batch['done']=self.buffer['done'][last]
+        Batch['discount']=(self.gamma**steps).astype(np.float32)
+        return Batch
+
+    def prioritized_sample(self):
+        # stratified sampling, one draw from each of batch_size equal slices
+        # of the total priority mass
+        total=self.tree.total()
+        values=(np.arange(self.batch_size)+random.rand(self.batch_size))* \
+               total/self.batch_size
+        indices=np.minimum(self.tree.find(values),self.buffersize-1)
+        # rounding can land on a zero priority slot at a slice boundary
+        invalid=~self.buffer['valid'][indices]
+        if invalid.any():
+            indices[invalid]=self.sample()[:invalid.sum()]
+        return indices
+
+    def weights(self,indices):
+        # importance sampling weights, normalized by the largest one
+        probability=self.tree.leaves(indices)/self.tree.total()
+        weights=(self.count*probability)**(-self.beta)
+        return (weights/weights.max()).astype(np.float32)
+
+    def update_priorities(self,indices,td_errors):
+        with self.lock:
+            priorities=np.abs(np.reshape(td_errors,[-1]))+self.epsilon
+            # slots invalidated since the batch was drawn must stay at zero
+            priorities*=self.buffer['valid'][indices]
+            self.max_priority=max(self.max_priority,priorities.max())
+            self.tree.update(indices,priorities**self.alpha)
 
     def add(self,experience):
-        if (self.currentPosition>=self.max_buffer-1):
+        with self.lock:
+            if self.pending is not None and self.continues(experience):
+                slot=self.pending
+            else:
+                slot=self.next_slot()
+                for key in self.observations:
+                    self.buffer[key][slot]=experience[key+'0']
+                self.episode+=1
+            if self.episode not in self.index:
+                self.index[self.episode]=[slot,0]
+            self.index[self.episode][1]+=1
+            self.buffer['episode'][slot]=self.episode
+            for key in ['action0','reward','done']:
+                self.buffer[key][slot]=experience[key]
+            following=self.next_slot()
+            for key in self.observations:
+                self.buffer[key][following]=experience[key+'1']
+            self.buffer['valid'][slot]=True
+            self.count+=1
+            if self.prioritized:
+                self.tree.set(slot,self.max_priority**self.alpha)
+            self.pending=None if experience['done'] else following
+            self.last={key:experience[key+'1'] for key in self.observations}
+
+    def continues(self,experience):
+        # identity first, it is what the run loops pass and costs nothing
+        if all(experience[key+'0'] is self.last[key] for key in self.observations):
+            return True
+        return all(np.array_equal(experience[key+'0'],self.last[key]) \
+                   for key in self.observations)
+
+    def next_slot(self):
+        slot=self.currentPosition
+        self.invalidate(slot)
+        self.written+=1
+        self.buffer['sequence'][slot]=self.written
+        self.currentPosition+=1
+        if self.currentPosition>=self.max_buffer:
             self.currentPosition=0
             self.max=True
+        self.buffersize=min(self.buffersize+1,self.max_buffer)
+        return slot
+
+    def invalidate(self,slot):
+        if self.buffer['valid'][slot]:
+            self.buffer['valid'][slot]=False
+            self.count-=1
+            # slots are overwritten oldest first, so this is the first
+            # transition of its episode (or the last one after a load)
+            episode=int(self.buffer['episode'][slot])
+            if episode in self.index:
+                start,length=self.index[episode]
+                if length==1:
+                    del self.index[episode]
+                elif start==slot:
+                    self.index[episode]=[(slot+1)%self.max_buffer,length-1]
+                else:
+                    self.index[episode]=[start,length-1]
+            if self.prioritized:
+                self.tree.set(slot,0.0)
+
+    def clear(self):
+        with self.lock:
+            self.currentPosition=0
+            self.buffersize=0
+            self.count=0
+            self.max=False
+            self.pending=None
+            self.last={}
+            self.index=OrderedDict()
+            self.buffer['valid'].fill(False)
+            self.buffer['sequence'].fill(0)
+            if self.prioritized:
+                self.max_priority=1.0
+                self.tree=SumTree(self.max_buffer)
+            if self.path is not None:
+                self.sync()
+
+    def sync(self):
+        # rows overwritten after the recorded sequence are dropped on load, so
+        # a crash between two syncs only loses the transitions added in
+        # between and the ones they overwrote.
+        for key in self.schema.keys():
+            self.buffer[key].flush()
+        meta={
+            'max_buffer':self.max_buffer,
+            'currentPosition':self.currentPosition,
+            'buffersize':self.buffersize,
+            'max':self.max,
+            'written':self.written,
+            'schema':{key:[shape,np.dtype(dtype).str] \
+                      for key,(shape,dtype) in self.schema.items()}
+        }
+        filename=os.path.join(self.path,'replay.json')
+        with open(filename+'.tmp','w') as f:
+            json.dump(meta,f)
+        os.rename(filename+'.tmp',filename)
+
+    def load(self):
+        # True if the buffer was restored from the last sync()
+        filename=os.path.join(self.path,'replay.json')
+        if not os.path.exists(filename):
+            return False
+        with open(filename) as f:
+            meta=json.load(f)
+        schema={key:[shape,np.dtype(dtype).str] \
+                for key,(shape,dtype) in self.schema.items()}
+        if meta['max_buffer']!=self.max_buffer or meta['schema']!=schema:
+            raise ValueError('replay buffer in '+self.path+' has a different layout')
+        self.currentPosition=meta['currentPosition']
+        self.buffersize=meta['buffersize']
+        self.max=meta['max']
+        self.written=meta['written']
+        # slots overwritten after the last sync, before or after the recorded
+        # cursor, no longer hold what the index was built from. drop them and
+        # the transitions whose next observation they hold.
+        sequence=self.buffer['sequence'][:]
+        stale=sequence>self.written
+        if stale.any():
+            valid=self.buffer['valid'][:]&~stale&~np.roll(stale,-1)
+            self.buffer['valid'][:]=valid
+            self.buffer['sequence'][np.flatnonzero(stale)]=0
+        self.rebuild_index()
+        self.count=int(np.count_nonzero(self.buffer['valid'][:self.buffersize]))
+        # the episode cannot be continued after a restart
+        if self.buffersize:
+            self.invalidate((self.currentPosition-1)%self.max_buffer)
+        if self.prioritized:
+            # transitions restored from disk start with the default priority
+            self.tree.update(np.arange(self.buffersize), \
+                             self.buffer['valid'][:self.buffersize].astype(np.float64))
+        return True
+
+    def rebuild_index(self):
+        # walk the valid slots from the oldest, a new run starts wherever the
+        # episode id changes or a slot is skipped
         if self.max:
-            for name in self.buffer.keys():
-                self.buffer[name][self.currentPosition]=experience[name]
+            order=(self.currentPosition+np.arange(self.max_buffer))%self.max_buffer
         else:
-            for name in self.buffer.keys():
-                self.buffer[name].append(experience[name])
-            self.buffersize+=1
-        self.currentPosition+=1
-    
-    def clear(self):
-        self.currentPosition=-1
-        self.buffersize=0
-        self.buffer={key:[] for key in self.bufferkeys}
-        self.max=False
+            order=np.arange(self.buffersize)
+        slots=order[self.buffer['valid'][order]]
+        episodes=self.buffer['episode'][slots]
+        self.index=OrderedDict()
+        if len(slots)==0:
+            return
+        first=np.flatnonzero(np.concatenate([[True], \
+            (episodes[1:]!=episodes[:-1])| \
+            (slots[1:]!=(slots[:-1]+1)%self.max_buffer)]))
+        lengths=np.diff(np.append(first,len(slots)))
+        for start,length in zip(first,lengths):
+            episode=int(episodes[start])
+            if episode in self.index:
+                # an episode split in two runs cannot be indexed, keep the
+                # newer one
+                old,n=self.index.pop(episode)
+                self.buffer['valid'][(old+np.arange(n))%self.max_buffer]=False
+            self.index[episode]=[int(slots[start]),int(length)]
+        self.episode=int(episodes.max())
+
+    def episodes(self):
+        '''
+        Index of the episodes in the buffer, oldest first:
+        (episode ids,first slots,end slots,lengths). the transitions of an
+        episode are the slots start,start+1,...,end-1 modulo max_buffer.
+        '''
+        with self.lock:
+            ids,starts,lengths=self.spans()
+        return ids,starts,(starts+lengths)%self.max_buffer,lengths
+
+    def spans(self):
+        ids=np.array(list(self.index.keys()),dtype=np.int64)
+        spans=np.array(list(self.index.values()),dtype=np.int64).reshape([-1,2])
+        return ids,spans[:,0],spans[:,1]
+
+    def sample_sequences(self,batch_size,length):
+        '''
+        Sample batch_size windows of length consecutive transitions, each
+        within one episode and not crossing the end of the ring. returns the
+        batch keys stacked as [batch_size,length,...] plus the window 'start'
+        slots. windows are drawn uniformly among all that fit.
+        '''
+        with self.lock:
+            _,starts,lengths=self.spans()
+            # split the episodes that wrap around the end of the arrays
+            wrap=starts+lengths>self.max_buffer
+            head=np.where(wrap,self.max_buffer-starts,lengths)
+            tail=(starts+lengths-self.max_buffer)[wrap]
+            starts=np.concatenate([starts,np.zeros(len(tail),dtype=np.int64)])
+            lengths=np.concatenate([head,tail])
+            windows=np.maximum(lengths-length+1,0)
+            if windows.sum()==0:
+                raise ValueError('no episode holds %d transitions'%length)
+            run=random.choice(len(windows),batch_size,p=windows/float(windows.sum()))
+            first=starts[run]+(random.rand(batch_size)*windows[run]).astype(np.int64)
+            slots=(first[:,None]+np.arange(length)).reshape(-1)
+            Batch={}
+            for key in self.observations:
+                shape=[batch_size,length]+self.schema[key][0]
+                Batch[key+'0']=self.buffer[key][slots].reshape(shape)
+                Batch[key+'1']=self.buffer[key][(slots+1)%self.max_buffer].reshape(shape)
+            for key in ['action0','reward','done']:
+                shape=[batch_size,length]+self.schema[key][0]
+                Batch[key]=self.buffer[key][slots].reshape(shape)
+        Batch['start']=first
+        return Batch
+
+class SharedReplay(object):
+    '''
+    Replay shared by several processes through anonymous shared memory.
+    The slots are split into one shard per worker; worker k only adds to
+    shard(k), a Replay whose arrays and cursor live in the shared mapping,
+    so writers never contend and need no lock. batch() reads all shards in
+    place from the learner process, nothing is pickled or sent through pipes.
+    Create it before starting the workers (fork start method). A slot that
+    a worker overwrites while the learner gathers it can come out torn; only
+    the oldest slot of a shard is ever overwritten, so this is rare and the
+    buffer accepts it rather than locking the writers.
+    Prioritized, compressed and persistent storage are not supported.
+    '''
+
+    def __init__(self,max_buffer,batch_size,workers,observations=False, \
+                 action_dim=3,n_step=1,gamma=0.9):
+        self.batch_size=batch_size
+        self.workers=workers
+        shard_size=int(max_buffer)//workers
+        layout=Replay(1,batch_size,observations,action_dim)
+        self.bufferkeys=layout.bufferkeys
+        self.buffer={key:shared_array([workers*shard_size]+shape,dtype) \
+                     for key,(shape,dtype) in layout.schema.items()}
+        # currentPosition, buffersize, count and max of every shard
+        self.cursor=shared_array([workers,4],np.int64)
+        self.shards=[SharedShard(self.cursor[k],shard_size,batch_size,observations, \
+                                 action_dim=action_dim,n_step=n_step,gamma=gamma, \
+                                 buffer={key:array[k*shard_size:(k+1)*shard_size] \
+                                         for key,array in self.buffer.items()}) \
+                     for k in range(workers)]
+
+    def shard(self,k):
+        return self.shards[k]
+
+    @property
+    def count(self):
+        return int(self.cursor[:,2].sum())
+
+    def batch(self):
+        counts=self.cursor[:,2].copy()
+        total=counts.sum()
+        if total>self.batch_size:
+            sizes=random.multinomial(self.batch_size,counts/float(total))
+        else:
+            sizes=counts
+        batches=[]
+        for shard,size in zip(self.shards,sizes):
+            if size==0:
+                continue
+            if total>self.batch_size:
+                indices=shard.sample(size)
+            else:
+                indices=np.flatnonzero(shard.buffer['valid'][:shard.buffersize])
+            batches.append(shard.gather(indices))
+        return {key:np.concatenate([batch[key] for batch in batches]) \
+                for key in batches[0].keys()} if batches else {}
+
+class SharedShard(Replay):
+    # Replay with its counters kept in a shared int64 array, so the learner
+    # sees the cursor of the worker process writing the shard.
+
+    def __init__(self,cursor,*args,**kwargs):
+        self.cursor=cursor
+        Replay.__init__(self,*args,**kwargs)
+
+    def field(index):
+        return property(lambda self:int(self.cursor[index]), \
+                        lambda self,value:self.cursor.__setitem__(index,value))
+
+    currentPosition=field(0)
+    buffersize=field(1)
+    count=field(2)
+    max=property(lambda self:bool(self.cursor[3]), \
+                 lambda self,value:self.cursor.__setitem__(3,value))
+    del field
+
+def shared_array(shape,dtype):
+    # MAP_SHARED|MAP_ANONYMOUS mapping, zero filled on first touch and
+    # inherited by forked processes
+    size=int(np.prod(shape))*np.dtype(dtype).itemsize
+    return np.frombuffer(mmap.mmap(-1,max(size,1)),dtype=dtype, \
+                         count=int(np.prod(shape))).reshape(shape)
+
+class SumTree(object):
+    '''
+    Binary tree over capacity leaves where every node holds the sum of its
+    children, stored as a flat array with the root at 1 and the leaves at
+    [size,size+capacity). set, update and find are O(log capacity); update
+    and find are vectorized over arrays of leaves/values.
+    '''
+
+    def __init__(self,capacity):
+        self.capacity=int(capacity)
+        self.size=1
+        while self.size<self.capacity:
+            self.size*=2
+        self.tree=np.zeros(2*self.size,dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def leaves(self,indices):
+        return self.tree[np.asarray(indices)+self.size]
+
+    def set(self,idx,priority):
+        node=idx+self.size
+        self.tree[node]=priority
+        node//=2
+        while node>=1:
+            self.tree[node]=self.tree[2*node]+self.tree[2*node+1]
+            node//=2
+
+    def update(self,indices,priorities):
+        # parents are recomputed from their children rather than adjusted by
+        # deltas, so repeated indices in one call are handled correctly.
+        nodes=np.asarray(indices,dtype=np.int64)+self.size
+        self.tree[nodes]=priorities
+        nodes=np.unique(nodes//2)
+        while len(nodes) and nodes[-1]>=1:
+            self.tree[nodes]=self.tree[2*nodes]+self.tree[2*nodes+1]
+            nodes=np.unique(nodes[nodes>1]//2)
+
+    def find(self,values):
+        values=np.array(values,dtype=np.float64)
+        nodes=np.ones(len(values),dtype=np.int64)
+        while nodes[0]<self.size:
+            left=self.tree[2*nodes]
+            right=values>=left
+            values-=left*right
+            nodes=2*nodes+right
+        return nodes-self.size
+
+class Compressed(object):
+    '''
+    Losslessly compressed frames of shape [height,width,channels], one zlib
+    stream per frame for the color channels and one for the rest. Color
+    channels are delta coded down the image columns first. The remaining
+    (depth) channels are the bytes of a float32 depth image: they are split
+    into byte planes, which compress well on their own, and not delta coded.
+    Reading an array of indices decodes the frames on the given pool.
+    '''
+
+    def __init__(self,length,shape,dtype,color_channels=3,level=1,pool=None):
+        self.shape=list(shape)
+        self.dtype=dtype
+        self.color_channels=color_channels
+        self.level=level
+        self.pool=pool
+        self.frames=[None]*length
+
+    def encode(self,frame):
+        frame=np.asarray(frame,dtype=self.dtype)
+        color=frame[:,:,:self.color_channels]
+        color=np.concatenate([color[:1],np.diff(color,axis=0)],axis=0)
+        depth=np.ascontiguousarray(np.transpose(frame[:,:,self.color_channels:],[2,0,1]))
+        return (zlib.compress(color.tobytes(),self.level), \
+                zlib.compress(depth.tobytes(),self.level))
+
+    def decode(self,idx,out=None):
+        height,width,channels=self.shape
+        color,depth=self.frames[idx]
+        if out is None:
+            out=np.empty(self.shape,dtype=self.dtype)
+        color=np.frombuffer(zlib.decompress(color),dtype=self.dtype) \
+            .reshape([height,width,self.color_channels])
+        np.cumsum(color,axis=0,dtype=self.dtype,out=out[:,:,:self.color_channels])
+        depth=np.frombuffer(zlib.decompress(depth),dtype=self.dtype) \
+            .reshape([channels-self.color_channels,height,width])
+        out[:,:,self.color_channels:]=np.transpose(depth,[1,2,0])
+        return out
+
+    def nbytes(self):
+        total=0
+        for frame in self.frames:
+            if frame is not None:
+                total+=len(frame[0])+len(frame[1])
+        return total
+
+    def __setitem__(self,idx,value):
+        self.frames[idx]=self.encode(value)
+
+    def __getitem__(self,idx):
+        if isinstance(idx,slice):
+            idx=np.arange(len(self.frames))[idx]
+        idx=np.asarray(idx)
+        if idx.ndim==0:
+            return self.decode(int(idx))
+        out=np.empty([len(idx)]+self.shape,dtype=self.dtype)
+        jobs=[(int(i),out[n]) for n,i in enumerate(idx)]
+        if self.pool is None or len(jobs)<2:
+            for i,frame in jobs:
+                self.decode(i,frame)
+        else:
+            self.pool.map(lambda job:self.decode(*job),jobs)
+        return out
+
+    def flush(self):
+        pass
+
+class Segments(object):
+    '''
+    Array of length rows split into .npy files of segment_size rows each.
+    Segments are memory-mapped and created on first write, so the files grow
+    with the buffer and reopening them does not read anything into memory.
+    Rows of segments not created yet read as zeros. Reads may run on
+    another thread than the writes (see Replay.batch), a segment file is
+    opened or created by one thread at a time.
+    '''
+
+    def __init__(self,path,name,length,shape,dtype,segment_size):
+        self.path=path
+        self.name=name
+        self.length=length
+        self.shape=list(shape)
+        self.dtype=dtype
+        self.segment_size=int(segment_size)
+        self.segments=[None]*(-(-length//self.segment_size))
+        self.lock=threading.Lock()
+
+    def filename(self,idx):
+        return os.path.join(self.path,'%s.%04d.npy'%(self.name,idx))
+
+    def segment(self,idx,create=True):
+        # None for a missing segment unless create
+        if self.segments[idx] is None:
+            with self.lock:
+                filename=self.filename(idx)
+                if self.segments[idx] is not None:
+                    pass
+                elif os.path.exists(filename):
+                    self.segments[idx]=open_memmap(filename,mode='r+')
+                elif create:
+                    rows=min(self.segment_size,self.length-idx*self.segment_size)
+                    self.segments[idx]=open_memmap(filename,mode='w+', \
+                        dtype=self.dtype,shape=tuple([rows]+self.shape))
+        return self.segments[idx]
+
+    def __setitem__(self,idx,value):
+        if isinstance(idx,slice):
+            idx=np.arange(self.length)[idx]
+        idx=np.asarray(idx)
+        if idx.ndim==0:
+            seg,offset=divmod(int(idx),self.segment_size)
+            self.segment(seg)[offset]=value
+            return
+        value=np.asarray(value)
+        seg=idx//self.segment_size
+        for s in np.unique(seg):
+            mask=seg==s
+            self.segment(s)[idx[mask]-s*self.segment_size]= \
+                value[mask] if value.ndim else value
+
+    def __getitem__(self,idx):
+        if isinstance(idx,slice):
+            idx=np.arange(self.length)[idx]
+        idx=np.asarray(idx)
+        if idx.ndim==0:
+            seg,offset=divmod(int(idx),self.segment_size)
+            segment=self.segment(seg,create=False)
+            if segment is None:
+                return np.zeros(self.shape,dtype=self.dtype)[()]
+            return segment[offset]
+        out=np.zeros([len(idx)]+self.shape,dtype=self.dtype)
+        seg=idx//self.segment_size
+        for s in np.unique(seg):
+            segment=self.segment(s,create=False)
+            if segment is not None:
+                mask=seg==s
+                out[mask]=segment[idx[mask]-s*self.segment_size]
+        return out
+
+    def fill(self,value):
+        # like ndarray.fill for the zero value new segments start with,
+        # segments that do not exist yet are left alone
+        for idx in range(len(self.segments)):
+            segment=self.segment(idx,create=False)
+            if segment is not None:
+                segment.fill(value)
+
+    def flush(self):
+        for segment in self.segments:
+            if segment is not None:
+                segment.flush()
@@ -0,0 +1,25 @@
+'''
+Layers of the rgbd encoder, config.layers['rgbd'], one entry per layer:
+
+    [kh,kw,in,out]                       stride 1 conv, relu, 2x2 max-pool
+    ('conv',[kh,kw,in,out],options)      conv, relu, optional 2x2 max-pool
+    ('separable',[kh,kw,in,out],options) depthwise kh x kw conv with a channel
+                                         multiplier, 1x1 conv to out, relu,
+                                         optional 2x2 max-pool
+    ('global_pool','avg' or 'max')       pooling over height and width
+
+options is an optional dict of stride (1), pool (True) and, for separable,
+multiplier (1). Convolutions use SAME padding. No TensorFlow here, the
+numpy actor reads the same spec.
+'''
+
+DEFAULTS={'stride':1,'pool':True,'multiplier':1}
+
+def rgbd_layer(entry):
+    # (kind, shape or pooling, options) of one entry
+    if isinstance(entry[0],(int,float)):
+        return 'conv',list(entry),dict(DEFAULTS)
+    options=dict(DEFAULTS)
+    if len(entry)>2:
+        options.update(entry[2])
+    return entry[0],entry[1],options
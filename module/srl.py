@@ -2,6 +2,8 @@ import tensorflow as tf
 import numpy as np
 import copy
 
+from .profiler import Profiler
+
 class SRL:
     def __init__(self, config):
         if config.gpu:
@@ -27,9 +29,11 @@ class SRL:
         # observation networks
         for key in config.observation_networks.keys():
             with tf.name_scope(key+'_net'):
+                # rgbd is fed as uint8 and converted in the graph
                 self.observation[name] = tf.placeholder( \
-                        tf.float32,[None]+config.observation_dim[name])
-                out[key] = self.observation[key]
+                        tf.uint8 if key=='rgbd' else tf.float32,[None]+config.observation_dim[name])
+                out[key] = normalize(self.observation[key],config.rgbd_scale) \
+                        if key=='rgbd' else self.observation[key]
                 for idx,(type,layer) in enumerate(config.observation_networks[key]):
                     create_variable(layer,type+str(idx))
                     out[key]=
@@ -76,6 +80,7 @@ class SRL:
                 config.tau*self.critic_net.variables[var.replace('_target','_net')]+ \
                 (1-config.tau)*self.critic_target.variables[var] \
             ) for var in self.critic_target.variables.keys()]
+        self.profiler=Profiler(config.trace_dir,config.trace_start,config.trace_steps)
         # initialize variables
         self.var_init=tf.global_variables_initializer()
         self.sess.run(self.var_init)
@@ -85,7 +90,7 @@ class SRL:
 
     def chooseAction(self,state):
         state_vector=np.reshape(state['vector'],[1,-1])
-        state_rgbd=np.reshape(state['rgbd'],[1,96,128,7])
+        state_rgbd=np.reshape(state['rgbd'],[1,96,128,7]).astype(np.uint8,copy=False)
         action=self.actor_net.evaluate(state_vector,state_rgbd)
         # action=self.sess.run(self.actor_net.out_before_activation, \
         #     feed_dict={self.actor_net.state_vector:state_vector, \
@@ -97,29 +102,40 @@ class SRL:
         return np.reshape(action,[self.action_dim])
 
     def learn(self,batch):
-        vector0=np.reshape(batch['vector0'],self.vector_dim)
-        rgbd0=np.reshape(batch['rgbd0'],self.rgbd_dim)
-        vector1=np.reshape(batch['vector1'],self.vector_dim)
-        rgbd1=np.reshape(batch['rgbd1'],self.rgbd_dim)
-        action0=np.reshape(batch['action0'],[-1,self.action_dim])
-        reward=np.reshape(batch['reward'],[-1,1])
-        done=np.reshape(batch['done'],[-1,1])
-        target_action=self.actor_target.evaluate(vector1,rgbd1)
-        target_q=self.critic_target.evaluate(vector1,rgbd1,action=target_action)
-        self.sess.run(self.update_critic, \
+        with self.profiler.phase('reshape'):
+            vector0=np.reshape(batch['vector0'],self.vector_dim)
+            rgbd0=np.reshape(batch['rgbd0'],self.rgbd_dim).astype(np.uint8,copy=False)
+            vector1=np.reshape(batch['vector1'],self.vector_dim)
+            rgbd1=np.reshape(batch['rgbd1'],self.rgbd_dim).astype(np.uint8,copy=False)
+            action0=np.reshape(batch['action0'],[-1,self.action_dim])
+            reward=np.reshape(batch['reward'],[-1,1])
+            done=np.reshape(batch['done'],[-1,1])
+        with self.profiler.phase('target'):
+            target_action=self.actor_target.evaluate(vector1,rgbd1)
+            target_q=self.critic_target.evaluate(vector1,rgbd1,action=target_action)
+        self.profiler.run(self.sess,'critic',self.update_critic, \
                       feed_dict={self.critic_net.state_vector:vector0, \
                                  self.critic_net.state_rgbd:rgbd0, \
                                  self.critic_net.action:action0, \
                                  self.reward:reward, \
                                  self.target_q:target_q, \
                                  self.done:done})
-        self.sess.run(self.update_actor, \
+        self.profiler.run(self.sess,'actor',self.update_actor, \
                       feed_dict={self.critic_net.state_vector:vector0, \
                                  self.critic_net.state_rgbd:rgbd0, \
                                  self.critic_net.action:action0, \
                                  self.actor_net.state_vector:vector0, \
                                  self.actor_net.state_rgbd:rgbd0})
-        self.sess.run(self.assign_target_soft)
+        self.profiler.run(self.sess,'soft_update',self.assign_target_soft)
+        self.profiler.step()
+
+    def stats(self):
+        # wall-clock time per learn() phase, see profiler.py
+        return self.profiler.stats()
+
+    def profile(self,trace_dir,steps,start=None):
+        # chrome traces of the next steps learn() calls
+        self.profiler.trace(trace_dir,self.profiler.steps if start is None else start,steps)
 
     def reset(self):
         self.sess.run(self.var_init)
@@ -148,7 +164,7 @@ class Build_network(object):
         self.trainable=trainable
         with tf.name_scope(name):
             self.state_vector=tf.placeholder(tf.float32,config.vector_dim)
-            self.state_rgbd=tf.placeholder(tf.float32,config.rgbd_dim)
+            self.state_rgbd=tf.placeholder(tf.uint8,config.rgbd_dim)
             layers['merge'][0][0]= \
                     layers['rgbd'][-1][-1]* \
                     config.rgbd_dim[1]* \
@@ -176,7 +192,7 @@ class Build_network(object):
             out_vector=self.state_vector
             for layer in range(len(layers['vector'])):
                 out_vector=self.fc(out_vector,'vector'+str(layer))
-            out_rgbd=self.state_rgbd
+            out_rgbd=normalize(self.state_rgbd,config.rgbd_scale)
             for layer in range(len(layers['rgbd'])):
                 out_rgbd=self.conv(out_rgbd,'rgbd'+str(layer))
             out_rgbd=tf.reshape(out_rgbd, \
@@ -208,7 +224,7 @@ class Build_AC(object):
         self.trainable=False if name.split('_')[1]=='target' else True
         with tf.name_scope(name):
             self.state_vector=tf.placeholder(tf.float32,config.vector_dim)
-            self.state_rgbd=tf.placeholder(tf.float32,config.rgbd_dim)
+            self.state_rgbd=tf.placeholder(tf.uint8,config.rgbd_dim)
             layers['merge'][0][0]= \
                     layers['rgbd'][-1][-1]* \
                     config.rgbd_dim[1]* \
@@ -236,7 +252,7 @@ class Build_AC(object):
             out_vector=self.state_vector
             for layer in range(len(layers['vector'])):
                 out_vector=self.fc(out_vector,'vector'+str(layer))
-            out_rgbd=self.state_rgbd
+            out_rgbd=normalize(self.state_rgbd,config.rgbd_scale)
             for layer in range(len(layers['rgbd'])):
                 out_rgbd=self.conv(out_rgbd,'rgbd'+str(layer))
             out_rgbd=tf.reshape(out_rgbd, \
@@ -294,6 +310,11 @@ def create_variable(shape,name,trainable=True):
             tf.Variable( \
                 tf.random_normal(shape[3],stddev=stddev),name='b',trainable=trainable)
 
+def normalize(rgbd,scale):
+    # uint8 frames to float32 inside the graph
+    out_=tf.cast(rgbd,tf.float32)
+    return out_ if scale==1.0 else out_*scale
+
 def l2_regularizer(vars):
     loss=0
     for var in vars:
@@ -5,17 +5,33 @@ class Settings(object):
 
     def default(self):
         self.load_buffer=True
+        self.buffer_path='buffer'
         self.gpu=True
         self.vector_dim=[None,42]
         self.rgbd_dim=[None,96,128,7]
+        self.rgbd_scale=1.0 # uint8 rgbd is scaled in the graph, 1.0 keeps the 0-255 range
         self.action_dim=3
         self.action_bounds=[[0.2,0.2,0.5],[-0.2,-0.2,-0.5]] # [max,min]
         self.gamma=0.9 # discount factor
+        self.n_step=1 # length of the sampled n-step returns
         self.critic_learning_rate=1e-3
         self.actor_learning_rate=1e-4
         self.tau=1e-3
+        self.target_update_every=1 # soft target update every k steps, tau compounded over k
         self.l2_penalty=1e-5
+        self.shared_encoder=False # actor and critic heads on one vector/rgbd encoder
         self.max_buffer=1e+5
+        self.prioritized=False # prioritized experience replay
+        self.priority_alpha=0.6
+        self.priority_beta=0.4
+        self.prefetch=4 # batches sampled ahead on a background thread, 0 disables
+        self.async_learner=False # learn on a background thread while acting
+        self.update_ratio=1.0 # async learner updates per env step, 0 for no limit
+        self.publish_every=100 # async learner updates between actor refreshes
+        self.profile_phases=False # one sess.run per learn() phase, to time them
+        self.trace_dir=None # chrome traces of learn() steps go here
+        self.trace_start=100
+        self.trace_steps=0
         self.batch_size=64
         self.max_step=1e+3
         self.max_episode=1e+4
@@ -25,7 +41,7 @@ class Settings(object):
                 [42,200],
                 [200,200]
             ],
-            'rgbd':[
+            'rgbd':[ # entries as in module/spec.py
                 [5,5,7,1],
                 [3,3,1,1],
                 [3,3,1,1]
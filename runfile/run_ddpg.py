@@ -7,7 +7,7 @@ import random
 import time
 
 from env_reset import env_reset
-from module import ddpg, replay, liveplot
+from module import ddpg, replay, prefetch, learner, liveplot
 
 from ddpg_config import config
 
@@ -36,12 +36,24 @@ if __name__ == '__main__':
 
     ddpg = ddpg.DDPG(config)
 
-    memory = replay.Replay(config.max_buffer, config.batch_size)
-    if config.load_buffer:
-        try:
-            memory.buffer=numpy.load('buffer.npy').item()
-        except:
-            pass
+    memory = replay.Replay(config.max_buffer, config.batch_size, \
+                           action_dim=config.action_dim, \
+                           path=config.buffer_path, \
+                           load=config.load_buffer, \
+                           prioritized=config.prioritized, \
+                           alpha=config.priority_alpha, \
+                           beta=config.priority_beta, \
+                           n_step=config.n_step, \
+                           gamma=config.gamma)
+
+    if config.prefetch:
+        sampler = prefetch.Prefetcher(memory, ddpg.prepare, config.prefetch)
+
+    if config.async_learner:
+        async_learner = learner.AsyncLearner(ddpg, memory, \
+                                sampler if config.prefetch else None, \
+                                ratio=config.update_ratio, \
+                                publish_every=config.publish_every)
 
     initial_epsilon = ddpg.epsilon
 
@@ -69,13 +81,12 @@ if __name__ == '__main__':
                 'vector0':state0['vector'],
                 'rgbd0':state0['rgbd'],
                 'vector1':state1['vector'],
-                'rgbd1':state0['rgbd'],
+                'rgbd1':state1['rgbd'],
                 'action0':action,
                 'reward':reward,
                 'done':done
             }
             memory.add(experience)
-            numpy.save('buffer.npy',memory.buffer)
 
             cumulated_reward += reward
 
@@ -84,8 +95,13 @@ if __name__ == '__main__':
 
             #nextState = ''.join(map(str, observation))
 
-            batch=memory.batch()
-            ddpg.learn(batch)
+            if config.async_learner:
+                async_learner.step()
+            else:
+                batch=sampler.get() if config.prefetch else memory.batch()
+                td_error=ddpg.learn(batch)
+                if 'indices' in batch:
+                    memory.update_priorities(batch['indices'],td_error)
 
             # env._flush(force=True)
 
@@ -95,9 +111,12 @@ if __name__ == '__main__':
                 last_time_steps = numpy.append(last_time_steps, [int(i + 1)])
                 break
 
+        memory.sync()
+
         if x%100==0:
             # plotter.plot(env)
-            numpy.save('weights.npy',ddpg.return_variables())
+            ddpg.save('weights')
+            ddpg.export_actor('actor.npz')
         
         m, s = divmod(int(time.time() - start_time), 60)
         h, m = divmod(m, 60)
@@ -113,4 +132,7 @@ if __name__ == '__main__':
     print("Overall score: {:0.2f}".format(last_time_steps.mean()))
     print("Best 100 score: {:0.2f}".format(reduce(lambda x, y: x + y, l[-100:]) / len(l[-100:])))
 
+    if config.async_learner:
+        async_learner.close()
+    ddpg.save('weights',wait=True)
     env.close()
@@ -35,6 +35,13 @@ if __name__ == '__main__':
     qlearn = qlearn.QLearn(actions=range(env.action_space.n),
                     alpha=0.2, gamma=0.8, epsilon=0.9)
 
+    # transition log for offline sweeps (run_qlearn_offline.py), written
+    # as append-only chunks holding the transitions and state keys added
+    # since the previous chunk
+    log = {'state':[], 'action':[], 'reward':[], 'next_state':[], 'done':[]}
+    chunk = 0
+    logged_keys = 0
+
     initial_epsilon = qlearn.epsilon
 
     epsilon_discount = 0.9986
@@ -55,6 +62,8 @@ if __name__ == '__main__':
         if qlearn.epsilon > 0.05:
             qlearn.epsilon *= epsilon_discount
 
+        qlearn.resetTraces()
+
         #render() #defined above, not env.render()
 
         state = ''.join(map(str, observation))
@@ -74,6 +83,11 @@ if __name__ == '__main__':
             nextState = ''.join(map(str, observation))
 
             qlearn.learn(state, action, reward, nextState)
+            log['state'].append(qlearn.intern(state))
+            log['action'].append(qlearn.action_index[action])
+            log['reward'].append(reward)
+            log['next_state'].append(qlearn.intern(nextState))
+            log['done'].append(done)
 
             env._flush(force=True)
 
@@ -85,6 +99,14 @@ if __name__ == '__main__':
         
         if x%100==0:
             plotter.plot(env)
+            keys = qlearn.stateKeys()
+            numpy.savez('qlearn_log.%04d.npz' % chunk, keys=numpy.array(keys[logged_keys:], dtype=str), \
+                        n_actions=len(qlearn.actions), **log)
+            chunk += 1
+            logged_keys = len(keys)
+            for values in log.values():
+                del values[:]
+            qlearn.save('qtable.bin')
         env_reset().rand_move(rand_deploy_list[1], rand_deploy_list[2])
 
         m, s = divmod(int(time.time() - start_time), 60)
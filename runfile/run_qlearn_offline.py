@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+import sys
+import glob
+import time
+import numpy
+
+from module import qlearn
+
+if __name__ == '__main__':
+
+    # re-run Q-learning sweeps over the transitions logged by run_qlearn.py,
+    # no gazebo needed
+    prefix = sys.argv[1] if len(sys.argv) > 1 else 'qlearn_log'
+    sweeps = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    # chunks hold the transitions and keys added since the previous one
+    chunks = [numpy.load(filename) for filename in sorted(glob.glob(prefix + '.*.npz'))]
+    if not chunks:
+        sys.exit('no transition log ' + prefix + '.*.npz')
+    log = {key: numpy.concatenate([chunk[key] for chunk in chunks])
+           for key in ['keys', 'state', 'action', 'reward', 'next_state', 'done']}
+    log['n_actions'] = chunks[0]['n_actions']
+
+    qlearn = qlearn.QLearn(actions=range(int(log['n_actions'])),
+                    alpha=0.2, gamma=0.8, epsilon=0.0)
+    # map the logged row ids to rows of the new table. keys are ordered by
+    # row id, a shared table leaves '' for its empty rows
+    rows = numpy.zeros(len(log['keys']), dtype=numpy.int64)
+    for idx, state in enumerate(log['keys']):
+        if str(state):
+            rows[idx] = qlearn.intern(str(state))
+    states, next_states = rows[log['state']], rows[log['next_state']]
+
+    start_time = time.time()
+
+    for x in range(sweeps):
+        change = qlearn.learnBatch(states, log['action'], log['reward'],
+                                   next_states, log['done'])[0]
+        print ("SWEEP: "+str(x+1)+" - transitions: "+str(len(log['state']))+" - max change: "+str(round(change,6))+"     Time: %.2fs" % (time.time() - start_time))
+
+    qlearn.save('qtable_offline.bin')
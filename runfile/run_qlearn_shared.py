@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+import os
+import sys
+import gym
+import RL_mlcs
+import time
+import numpy
+import random
+import multiprocessing
+
+from env_reset import env_reset
+from module import qlearn
+
+n_actions = 6 # qlearn-v0: F,B,L,R,LF,RF
+total_episodes = 10000
+epsilon_discount = 0.9986
+
+def worker(rank, workers, qlearn, done_episodes):
+    # every worker drives its own roscore/gazebo pair, see gazebo_env.py
+    os.environ["ROS_PORT_SIM"] = str(11311 + 2*rank)
+    os.environ["GAZEBO_PORT_SIM"] = str(11345 + 2*rank)
+    os.environ["ROS_MASTER_URI"] = "http://localhost:" + os.environ["ROS_PORT_SIM"]
+    os.environ["GAZEBO_MASTER_URI"] = "http://localhost:" + os.environ["GAZEBO_PORT_SIM"]
+    # forked workers inherit the same random state
+    random.seed(os.getpid())
+    numpy.random.seed(os.getpid())
+
+    env = gym.make('qlearn-v0')
+    env_reset().gazebo_warmup()
+
+    start_time = time.time()
+
+    for x in range(rank, total_episodes, workers):
+        cumulated_reward = 0
+
+        rand_deploy_list = env_reset().rand_deploy()
+
+        observation = env.reset()
+
+        # epsilon is per worker, decayed as if it ran every episode
+        qlearn.epsilon = max(0.05, 0.9 * epsilon_discount**x)
+        qlearn.resetTraces()
+
+        state = ''.join(map(str, observation))
+
+        for i in range(1500):
+            action = qlearn.chooseAction(state)
+
+            observation, reward, done, info = env.step(action)
+            cumulated_reward += reward
+
+            nextState = ''.join(map(str, observation))
+
+            # Hogwild update of the shared table
+            qlearn.learn(state, action, reward, nextState)
+
+            if not(done):
+                state = nextState
+            else:
+                break
+
+        env_reset().rand_move(rand_deploy_list[1], rand_deploy_list[2])
+
+        with done_episodes.get_lock():
+            done_episodes.value += 1
+            episodes = done_episodes.value
+        if rank == 0 and x % 100 == 0:
+            qlearn.save('qtable.bin')
+
+        m, s = divmod(int(time.time() - start_time), 60)
+        h, m = divmod(m, 60)
+        print ("WORKER: "+str(rank)+" - EP: "+str(x+1)+" ("+str(episodes)+" total) - [epsilon: "+str(round(qlearn.epsilon,2))+"] - Reward: "+str(cumulated_reward)+" - States: "+str(qlearn.used[0])+"     Time: %d:%02d:%02d" % (h, m, s))
+
+    env.close()
+
+if __name__ == '__main__':
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+
+    # the table must exist before the workers are forked so that they all
+    # map the same shared memory
+    qlearn = qlearn.SharedQLearn(actions=range(n_actions),
+                    alpha=0.2, gamma=0.8, epsilon=0.9, capacity=1 << 18)
+    done_episodes = multiprocessing.Value('l', 0)
+
+    processes = [multiprocessing.Process(target=worker, args=(k, workers, qlearn, done_episodes))
+                 for k in range(workers)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+
+    qlearn.save('qtable.bin')
+    print ("States: "+str(qlearn.used[0])+" - Episodes: "+str(done_episodes.value))
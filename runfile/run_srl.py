@@ -6,7 +6,7 @@ import numpy
 import random
 
 from env_reset import env_reset
-from module import srl, srl_replay, liveplot
+from module import srl, replay, liveplot
 
 from srl_config import config
 
@@ -37,12 +37,10 @@ if __name__ == '__main__':
 
     memory = replay.Replay(config.max_buffer, \
                            config.batch_size, \
-                           observations='lidar','rgbd','proximity','control'])
-    if config.load_buffer:
-        try:
-            memory.buffer=numpy.load('buffer.npy').item()
-        except:
-            pass
+                           observations=['lidar','rgbd','proximity','control'], \
+                           action_dim=config.action_dim[0], \
+                           path=config.buffer_path, \
+                           load=config.load_buffer)
 
     initial_epsilon = srl.epsilon
 
@@ -83,7 +81,6 @@ if __name__ == '__main__':
                 'done':done
             }
             memory.add(experience)
-            numpy.save('buffer.npy',memory.buffer)
 
             cumulated_reward += reward
 
@@ -103,6 +100,8 @@ if __name__ == '__main__':
                 last_time_steps = numpy.append(last_time_steps, [int(i + 1)])
                 break
 
+        memory.sync()
+
         if x%100==0:
             # plotter.plot(env)
             numpy.save('weights.npy',srl.return_variables())
@@ -5,6 +5,7 @@ class Settings(object):
 
     def default(self):
         self.load_buffer=True
+        self.buffer_path='buffer'
         self.gpu=True
         
         # dimension setup
@@ -18,6 +19,7 @@ class Settings(object):
         self.proximity_dim=[4]
         self.control_dim=[3]
         self.rgbd_dim=[96,128,4]
+        self.rgbd_scale=1.0 # uint8 rgbd is scaled in the graph, 1.0 keeps the 0-255 range
         self.state_dim=[50]
         self.action_dim=[3]
         
@@ -32,6 +34,9 @@ class Settings(object):
         self.max_step=1e+3
         self.max_episode=1e+4
         self.max_epoch=1e+7
+        self.trace_dir=None # chrome traces of learn() steps go here
+        self.trace_start=100
+        self.trace_steps=0
         self.observation_networks={
             'lidar':[
                 ('fc',[self.lidar_dim[0],200]),
@@ -0,0 +1,75 @@
+import numpy as np
+from numpy import random
+
+from module.qlearn import QLearn
+
+def table(n_states=6, n_actions=3):
+    qlearn = QLearn(actions=range(n_actions), epsilon=0.0, alpha=0.3, gamma=0.8,
+                    capacity=2)
+    for s in range(n_states):
+        qlearn.intern('s%d' % s)
+    return qlearn
+
+def random_log(rng, n_states, n_actions, length):
+    # few states and actions, so most (state, action) pairs repeat
+    return (rng.randint(n_states, size=length), rng.randint(n_actions, size=length),
+            rng.randn(length), rng.randint(n_states, size=length),
+            rng.rand(length) < 0.2)
+
+def sequential_sweep(qlearn, states, actions, rewards, next_states, dones):
+    # reference: targets from the table at the start of the sweep, then one
+    # learnQ call per logged transition in log order
+    keys = qlearn.stateKeys()
+    targets = rewards + qlearn.gamma * (1.0 - dones) * \
+        qlearn.q[next_states].max(axis=1).astype(np.float64)
+    for s, a, r, target in zip(states, actions, rewards, targets):
+        qlearn.learnQ(keys[s], qlearn.actions[a], r, target)
+
+def test_learn_batch_matches_sequential_learnq():
+    rng = random.RandomState(0)
+    batched, reference = table(), table()
+    # some pairs visited before the sweeps, the others start unvisited
+    for qlearn in [batched, reference]:
+        qlearn.learnQ('s0', 0, 1.5, 1.5)
+        qlearn.learnQ('s2', 1, -0.5, -0.5)
+        qlearn.learnQ('s2', 1, 0.0, 2.0)
+    log = random_log(rng, 6, 3, 60)
+    changes = batched.learnBatch(*log, sweeps=3)
+    for sweep in range(3):
+        before = reference.q.copy()
+        sequential_sweep(reference, *log)
+        np.testing.assert_allclose(changes[sweep], np.abs(reference.q - before).max(),
+                                   rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(batched.q, reference.q, rtol=1e-5, atol=1e-6)
+    np.testing.assert_array_equal(batched.visited, reference.visited)
+
+def test_learn_batch_repeated_unvisited_pair():
+    batched, reference = table(2, 2), table(2, 2)
+    # the first update of a new pair takes the reward, later ones blend in
+    log = (np.array([0, 0, 0, 1]), np.array([1, 1, 1, 0]),
+           np.array([1.0, 2.0, 3.0, 4.0]), np.array([1, 1, 1, 0]),
+           np.array([False, False, True, True]))
+    batched.learnBatch(*log)
+    sequential_sweep(reference, *log)
+    np.testing.assert_allclose(batched.q, reference.q, rtol=1e-6)
+    np.testing.assert_allclose(batched.q[0, 1], (1.0 * 0.7 + 0.3 * 2.0) * 0.7 + 0.3 * 3.0,
+                               rtol=1e-6)
+    assert batched.visited.tolist() == [[False, True], [True, False]]
+
+def test_save_load_round_trip(tmpdir):
+    rng = random.RandomState(1)
+    qlearn = table(5, 4)
+    qlearn.intern(u'état')
+    qlearn.learnBatch(*random_log(rng, 6, 4, 40))
+    filename = str(tmpdir.join('qtable.bin'))
+    qlearn.save(filename)
+    n = len(qlearn.states)
+    for mmap_mode in [None, 'r', 'c']:
+        loaded = QLearn.load(filename, mmap_mode=mmap_mode)
+        assert loaded.states == qlearn.states
+        assert loaded.actions == qlearn.actions
+        assert (loaded.alpha, loaded.gamma, loaded.epsilon) == \
+            (qlearn.alpha, qlearn.gamma, qlearn.epsilon)
+        np.testing.assert_array_equal(loaded.q[:n], qlearn.q[:n])
+        np.testing.assert_array_equal(loaded.visited[:n], qlearn.visited[:n])
+        assert loaded.getQ(u'état', 2) == qlearn.getQ(u'état', 2)
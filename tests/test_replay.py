@@ -0,0 +1,211 @@
+import os
+import numpy as np
+from numpy import random
+
+from module.replay import Replay, SumTree
+
+LAYOUT={'vector':([2],np.float32)}
+
+def state(value):
+    return {'vector':np.full(2,value,dtype=np.float32)}
+
+def run_episode(memory,first,steps,done=True,reward=None):
+    # steps transitions between states first,first+1,...; the reward of a
+    # transition is the value of its first state unless given
+    state0=state(first)
+    for t in range(steps):
+        state1=state(first+t+1)
+        memory.add({'vector0':state0['vector'],'vector1':state1['vector'], \
+                    'action0':np.zeros(3,dtype=np.float32), \
+                    'reward':first+t if reward is None else reward[t], \
+                    'done':done and t==steps-1})
+        state0=state1
+
+def all_valid(memory):
+    return np.flatnonzero(memory.buffer['valid'][:memory.buffersize])
+
+def check_transitions(memory):
+    # every valid transition leads from its state to the next one
+    batch=memory.gather(all_valid(memory))
+    np.testing.assert_array_equal(batch['vector1'][:,0],batch['vector0'][:,0]+1)
+    np.testing.assert_array_equal(batch['reward'],batch['vector0'][:,0])
+
+def test_wraparound():
+    memory=Replay(8,4,observations=LAYOUT)
+    run_episode(memory,0,12,done=False)
+    # 8 frames of the episode are left, so its 7 newest transitions
+    assert memory.count==7
+    assert memory.buffersize==8 and memory.max
+    check_transitions(memory)
+    ids,starts,ends,lengths=memory.episodes()
+    assert list(lengths)==[7]
+    assert starts[0]==(memory.currentPosition)%8
+    batch=memory.gather(all_valid(memory))
+    assert sorted(batch['vector0'][:,0])==list(range(5,12))
+
+def test_done_and_truncated_episodes():
+    memory=Replay(32,4,observations=LAYOUT)
+    run_episode(memory,0,3,done=True)
+    run_episode(memory,10,2,done=False)   # truncated: the next add starts over
+    run_episode(memory,20,2,done=True)
+    assert memory.count==7
+    check_transitions(memory)
+    _,_,_,lengths=memory.episodes()
+    assert list(lengths)==[3,2,2]
+    batch=memory.gather(all_valid(memory))
+    done={int(v):d for v,d in zip(batch['vector0'][:,0],batch['done'])}
+    assert [v for v in sorted(done) if done[v]]==[2,21]
+
+def test_n_step_returns():
+    memory=Replay(32,4,observations=LAYOUT,n_step=3,gamma=0.5)
+    run_episode(memory,0,4,done=True,reward=[1,2,3,4])
+    run_episode(memory,10,2,done=False,reward=[5,6])
+    batch=memory.gather(all_valid(memory))
+    by_state={int(v):n for n,v in enumerate(batch['vector0'][:,0])}
+    def row(value):
+        n=by_state[value]
+        return batch['reward'][n],batch['discount'][n],batch['done'][n],batch['vector1'][n,0]
+    np.testing.assert_allclose(row(0),[1+0.5*2+0.25*3,0.125,False,3])
+    np.testing.assert_allclose(row(1),[2+0.5*3+0.25*4,0.125,True,4])
+    np.testing.assert_allclose(row(2),[3+0.5*4,0.25,True,4])
+    np.testing.assert_allclose(row(3),[4,0.5,True,4])
+    # the truncated episode does not run into the next one
+    np.testing.assert_allclose(row(10),[5+0.5*6,0.25,False,12])
+    np.testing.assert_allclose(row(11),[6,0.5,False,12])
+
+def test_sum_tree_repeated_indices():
+    tree=SumTree(5)
+    tree.update([0,1,2,3,4],[1.0,1.0,1.0,1.0,1.0])
+    # the last priority of a repeated index wins and the sums stay exact
+    tree.update([1,3,1,3],[4.0,0.0,2.0,0.0])
+    np.testing.assert_allclose(tree.leaves([0,1,2,3,4]),[1,2,1,0,1])
+    assert tree.total()==5.0
+    np.testing.assert_array_equal(tree.find([0.5,1.0,2.9,3.0,4.99]),[0,1,1,2,4])
+
+def test_prioritized_batch_repeated_indices():
+    random.seed(0)
+    memory=Replay(16,8,observations=LAYOUT,prioritized=True,alpha=1.0,epsilon=0.0)
+    run_episode(memory,0,12,done=True)
+    memory.update_priorities(np.arange(12),np.ones(12))
+    memory.update_priorities(np.array([3,3,5]),np.array([10.0,20.0,0.0]))
+    assert memory.tree.leaves([3])[0]==20.0
+    assert memory.tree.total()==sum(memory.tree.leaves(np.arange(16)))
+    for _ in range(20):
+        batch=memory.batch()
+        assert memory.buffer['valid'][batch['indices']].all()
+        assert 5 not in batch['indices']
+
+def test_sync_load(tmpdir):
+    path=str(tmpdir.join('buffer'))
+    memory=Replay(8,4,observations=LAYOUT,path=path,segment_size=3)
+    run_episode(memory,0,3,done=True)
+    run_episode(memory,10,6,done=True)
+    memory.sync()
+    reopened=Replay(8,4,observations=LAYOUT,path=path,load=True,segment_size=3)
+    assert reopened.count==memory.count
+    assert reopened.currentPosition==memory.currentPosition
+    np.testing.assert_array_equal(all_valid(reopened),all_valid(memory))
+    for key,value in memory.gather(all_valid(memory)).items():
+        np.testing.assert_array_equal(reopened.gather(all_valid(reopened))[key],value)
+    assert [list(x) for x in reopened.episodes()[1:]]==[list(x) for x in memory.episodes()[1:]]
+    # and it keeps going
+    run_episode(reopened,20,4,done=True)
+    check_transitions(reopened)
+    assert list(reopened.episodes()[3])==[2,4]
+
+def reopen_after_crash(path,size,episodes):
+    # add episodes (first,steps,done), sync after the first; the others
+    # reach the memory-mapped files but not the recorded cursor
+    memory=Replay(size,4,observations=LAYOUT,path=path)
+    for n,(first,steps,done) in enumerate(episodes):
+        run_episode(memory,first,steps,done=done)
+        if n==0:
+            memory.sync()
+            synced=memory.gather(all_valid(memory))
+    return Replay(size,4,observations=LAYOUT,path=path,load=True),synced
+
+def test_load_drops_rows_written_after_sync(tmpdir):
+    memory,synced=reopen_after_crash(str(tmpdir.join('a')),50,[(0,10,True),(100,4,False)])
+    assert memory.count==10
+    np.testing.assert_array_equal(memory.gather(all_valid(memory))['vector0'],synced['vector0'])
+    run_episode(memory,200,3,done=True)
+    check_transitions(memory)
+    assert list(memory.episodes()[3])==[10,3]
+
+def test_load_drops_rows_written_after_sync_wrapped(tmpdir):
+    memory,synced=reopen_after_crash(str(tmpdir.join('b')),12,[(0,15,True),(100,4,False)])
+    # the 4 unsynced transitions overwrote the oldest 5 slots and are gone
+    assert memory.count==11-5
+    check_transitions(memory)
+    run_episode(memory,200,3,done=True)
+    check_transitions(memory)
+    assert list(memory.episodes()[3])==[6,3]
+
+def test_batch_replaces_rows_overwritten_while_gathering():
+    memory=Replay(16,8,observations=LAYOUT)
+    run_episode(memory,0,15,done=True)
+    gather=memory.gather
+    def add_while_gathering(indices):
+        # add() only waits for the lock, emulate it running mid-gather
+        Batch=gather(indices)
+        if memory.gather is add_while_gathering:
+            memory.gather=gather
+            run_episode(memory,100,6,done=True)
+        return Batch
+    memory.gather=add_while_gathering
+    batch=memory.batch()
+    assert len(batch['reward'])==8
+    np.testing.assert_array_equal(batch['vector1'][:,0],batch['vector0'][:,0]+1)
+    np.testing.assert_array_equal(batch['reward'],batch['vector0'][:,0])
+    valid=memory.gather(all_valid(memory))['vector0'][:,0]
+    assert set(batch['vector0'][:,0])<=set(valid)
+
+def test_reopen_without_sync_discards_old_files(tmpdir):
+    path=str(tmpdir.join('buffer'))
+    memory=Replay(50,4,observations=LAYOUT,path=path,segment_size=16)
+    run_episode(memory,0,10,done=True)
+    memory.sync()
+    # not restored: a new buffer in the same directory
+    memory=Replay(50,4,observations=LAYOUT,path=path,segment_size=16)
+    run_episode(memory,100,3,done=True)
+    assert memory.count==3 and len(all_valid(memory))==3
+    check_transitions(memory)
+    # a crash before the first sync, with or without a replay.json
+    for n,meta in enumerate([True,False]):
+        path=str(tmpdir.join('unsynced%d'%n))
+        memory=Replay(50,4,observations=LAYOUT,path=path,segment_size=16)
+        run_episode(memory,0,10,done=True)
+        for segments in memory.buffer.values():
+            segments.flush()
+        if not meta:
+            os.remove(os.path.join(path,'replay.json'))
+        memory=Replay(50,4,observations=LAYOUT,path=path,segment_size=16,load=True)
+        assert memory.count==0 and len(all_valid(memory))==0
+        run_episode(memory,100,3,done=True)
+        assert memory.count==3 and len(all_valid(memory))==3
+
+def test_segment_reads_do_not_create_files(tmpdir):
+    path=str(tmpdir.join('buffer'))
+    memory=Replay(50,4,observations=LAYOUT,path=path,segment_size=4,n_step=3)
+    run_episode(memory,0,2,done=False)
+    files=set(os.listdir(path))
+    # n-step reads run past the newest slot into segments not written yet
+    batch=memory.gather(np.array([0,1,48]))
+    assert set(os.listdir(path))==files
+    assert batch['vector0'][2,0]==0 and not memory.buffer['valid'][49]
+
+def test_continuation_with_copied_observations():
+    memory=Replay(32,4,observations=LAYOUT)
+    state0=state(0)
+    for t in range(5):
+        state1=state(t+1)
+        # the caller converts the observations, equal but not the same arrays
+        memory.add({'vector0':np.array(state0['vector'],dtype=np.float64), \
+                    'vector1':state1['vector'].copy(), \
+                    'action0':np.zeros(3,dtype=np.float32), \
+                    'reward':t,'done':t==4})
+        state0=state1
+    assert memory.count==5 and memory.buffersize==6
+    _,_,_,lengths=memory.episodes()
+    assert list(lengths)==[5]
+    check_transitions(memory)